@@ -0,0 +1,115 @@
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class _CachedAnswer:
+    def __init__(self, owner: str, scope: Hashable, question: str, vector: np.ndarray, payload: Dict[str, Any]):
+        self.owner = owner
+        self.scope = scope
+        self.question = question
+        self.vector = vector
+        self.payload = payload
+        self.stored_at = time.time()
+
+
+class AnswerCache:
+    """
+    Semantic cache of RAG answers, isolated per user.
+
+    Answers are stored under (owner, scope), where scope identifies the
+    indexed documents and the retrieval settings that produced the answer.
+    Lookups take the question's embedding and return the cached answer whose
+    question is most similar within the same (owner, scope), provided the
+    cosine similarity reaches threshold. The cache holds at most max_entries
+    answers (least recently used are evicted), and entries expire after ttl
+    seconds.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 10_000, ttl: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, Hashable, str], _CachedAnswer]" = OrderedDict()
+        self._by_scope: Dict[Tuple[str, Hashable], Dict[str, _CachedAnswer]] = {}
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _drop(self, key: Tuple[str, Hashable, str]):
+        entry = self._entries.pop(key)
+        scoped = self._by_scope.get((entry.owner, entry.scope))
+        if scoped is not None:
+            scoped.pop(entry.question, None)
+            if not scoped:
+                del self._by_scope[(entry.owner, entry.scope)]
+
+    def lookup(self, owner: str, scope: Hashable, question_vector) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Return (payload, similarity) of the closest cached answer above threshold, or None."""
+        query = self._normalize(question_vector)
+        with self._lock:
+            scoped = self._by_scope.get((owner, scope))
+            now = time.time()
+            if scoped:
+                for question in [q for q, e in scoped.items() if now - e.stored_at >= self.ttl]:
+                    self._drop((owner, scope, question))
+                scoped = self._by_scope.get((owner, scope))
+            if not scoped:
+                self.misses += 1
+                return None
+            entries = list(scoped.values())
+            similarities = np.stack([e.vector for e in entries]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry = entries[best]
+            self._entries.move_to_end((owner, scope, entry.question))
+            self.hits += 1
+            return entry.payload, float(similarities[best])
+
+    def store(self, owner: str, scope: Hashable, question: str, question_vector, payload: Dict[str, Any]):
+        entry = _CachedAnswer(owner, scope, question, self._normalize(question_vector), payload)
+        key = (owner, scope, question)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._by_scope.setdefault((owner, scope), {})[question] = entry
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, owner: str) -> int:
+        """Drop every cached answer of one user, e.g. when their index is removed."""
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == owner]
+            for key in keys:
+                self._drop(key)
+            if keys:
+                self.invalidations += 1
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
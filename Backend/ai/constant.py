@@ -7,4 +7,62 @@ MAX_FILES_PER_USER = 1
 TOP_K = 5
 MAX_CONTENT_LENGTH = 50 * 1024 * 1024
 CHUNK_SIZE = 500
-DEFAULT_RERANKER = "cross_encoder"
\ No newline at end of file
+DEFAULT_RERANKER = "cross_encoder"
+SEMANTIC_EMBED_BATCH_SIZE = 256
+PARALLEL_PDF_EXTRACTION = True
+PDF_EXTRACT_WORKERS = None
+PDF_PAGES_PER_TASK = 8
+PIPELINE_QUEUE_SIZE = 2
+INGEST_WORKERS = 2
+INGEST_MAX_PENDING = 16
+EMBED_CACHE_PATH = "./.data/embedding_cache.sqlite"
+EMBED_CACHE_MAX_ENTRIES = 100_000
+STANDARD_CHUNK_SIZE = 500
+STANDARD_CHUNK_OVERLAP = 50
+SEMANTIC_SIMILARITY_THRESHOLD = 0.75
+SEMANTIC_MIN_CHUNK_SIZE = 100
+SEMANTIC_MAX_CHUNK_SIZE = 1500
+SPARSE_INDEX_DIR = "bm25"
+VDB_POOL_MAX_SIZE = 64
+VDB_POOL_IDLE_TIMEOUT = 600
+CONTEXT_TOKEN_BUDGET = 3000
+CHARS_PER_TOKEN = 4
+MIN_MERGE_OVERLAP = 8
+MAX_MERGE_OVERLAP = 200
+MIN_TRUNCATED_BLOCK_TOKENS = 64
+MULTI_QUERY_RETRIEVAL = True
+MULTI_QUERY_MAX_QUERIES = 4
+RRF_K = 60
+SEARCH_WORKERS = 4
+SPECULATIVE_RETRIEVAL = True
+SPECULATIVE_ENHANCEMENT_DEADLINE = 3.0
+ENHANCEMENT_WORKERS = 8
+ENHANCEMENT_CACHE_MAX_ENTRIES = 2048
+ENHANCEMENT_CACHE_TTL = 24 * 3600
+ENHANCEMENT_CACHE_PATH = "./.data/enhancement_cache.json"
+ENHANCEMENT_CACHE_FLUSH_INTERVAL = 5.0
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_MAX_ENTRIES = 10_000
+ANSWER_CACHE_TTL = 3600
+QUERY_COALESCING = True
+QUERY_COALESCING_TIMEOUT = 60
+EMBED_MEMO_ENABLED = True
+EMBED_MEMO_MAX_QUERIES = 4096
+EMBED_MEMO_MAX_DOCUMENTS = 16384
+EMBED_BATCHING_ENABLED = True
+EMBED_BATCH_MAX_SIZE = 32
+EMBED_BATCH_MAX_WAIT_MS = 5
+EMBED_BACKEND = "torch"
+EMBED_ONNX_QUANTIZATION = "avx512_vnni"
+EMBED_ONNX_DIR = "./.data/onnx"
+HYBRID_FETCH_K = 20
+DENSE_BACKEND = "chroma"
+FLAT_INDEX_DIR = "flat"
+FLAT_INDEX_DTYPE = "float32"
+MMR_FETCH_K = 20
+MMR_LAMBDA = 0.5
+CHUNK_PAGE_SIZE = 500
+STORAGE_MODE = "per_user"
+SHARED_DB_DIR = "./db/_shared"
+TENANT_SHARDS = 16
\ No newline at end of file
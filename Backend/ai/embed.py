@@ -1,11 +1,309 @@
 import os
+import queue
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
+from ai.constant import *
+from ai.embedding_cache import text_sha256, embedding_model_name
 
 load_dotenv()
 if os.getenv("HUGGINGFACEHUB_API_TOKEN"):
     os.environ["HUGGINGFACEHUB_API_TOKEN"] = os.getenv("HUGGINGFACEHUB_API_TOKEN")
 
+def _has_model_file(model_name: str, file_name: str) -> bool:
+    """True if model_name (a local directory or Hub repository) ships file_name; other lookup errors propagate."""
+    if os.path.isdir(model_name):
+        return os.path.exists(os.path.join(model_name, file_name))
+    from huggingface_hub import hf_hub_download
+    from huggingface_hub.errors import EntryNotFoundError, LocalEntryNotFoundError
+    try:
+        hf_hub_download(model_name, file_name)
+        return True
+    except LocalEntryNotFoundError:
+        raise
+    except EntryNotFoundError:
+        return False
+
+def onnx_int8_embeddings(model_name: str, quantization: str = "avx512_vnni", export_dir: str = "./.data/onnx") -> HuggingFaceEmbeddings:
+    """
+    Load model_name as a dynamically int8-quantized ONNX model on onnxruntime's CPU provider.
+
+    Uses the pre-quantized onnx/model_qint8_<quantization>.onnx from the model
+    repository when it ships one (all-MiniLM-L6-v2 does). Otherwise the model
+    is exported to ONNX and quantized once into export_dir. sentence-transformers
+    loads every ONNX model through optimum, so either way this needs the
+    optional optimum[onnxruntime] package. Loading never falls back to
+    sentence-transformers' automatic (unquantized) export.
+    """
+    try:
+        import optimum.onnxruntime  # noqa: F401
+    except ModuleNotFoundError:
+        raise RuntimeError('EMBED_BACKEND = "onnx-int8" needs optimum and onnxruntime: pip install "optimum[onnxruntime]==1.27.0"')
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    model_kwargs = {"backend": "onnx", "model_kwargs": {"file_name": file_name, "provider": "CPUExecutionProvider", "export": False}}
+    if _has_model_file(model_name, file_name):
+        return HuggingFaceEmbeddings(model=model_name, model_kwargs=model_kwargs)
+    print(f"No pre-quantized {file_name} for {model_name}, exporting one...")
+
+    local_dir = os.path.join(export_dir, model_name.replace("/", "__"))
+    if not os.path.exists(os.path.join(local_dir, file_name)):
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+        onnx_model = SentenceTransformer(model_name, backend="onnx", model_kwargs={"provider": "CPUExecutionProvider"})
+        onnx_model.save_pretrained(local_dir)
+        export_dynamic_quantized_onnx_model(onnx_model, quantization, local_dir)
+        print(f"Exported int8 ONNX model to {local_dir}")
+    return HuggingFaceEmbeddings(model=local_dir, model_kwargs=model_kwargs)
+
+def embedding_parity(reference: Embeddings, candidate: Embeddings, texts: List[str], queries: List[str], k: int = 5) -> Dict[str, Any]:
+    """
+    Compare two embedding backends on the same texts.
+
+    Reports per-text cosine similarity between the backends' vectors and how
+    many of each query's top-k nearest texts agree (recall@k of the candidate
+    against the reference ranking).
+    """
+    def normalized(vectors):
+        m = np.asarray(vectors, dtype=np.float32)
+        return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+    ref_docs, cand_docs = normalized(reference.embed_documents(texts)), normalized(candidate.embed_documents(texts))
+    ref_queries = normalized([reference.embed_query(q) for q in queries])
+    cand_queries = normalized([candidate.embed_query(q) for q in queries])
+    cosines = np.sum(ref_docs * cand_docs, axis=1)
+
+    k = min(k, len(texts))
+    ref_top = np.argsort(-(ref_queries @ ref_docs.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand_queries @ cand_docs.T), axis=1)[:, :k]
+    recall = [len(set(r) & set(c)) / k for r, c in zip(ref_top, cand_top)]
+    return {
+        "texts": len(texts),
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "queries": len(queries),
+        f"recall_at_{k}": float(np.mean(recall)) if recall else None
+    }
+
+class _LRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self.entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        vector = self.entries.get(key)
+        if vector is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return vector
+
+    def put(self, key: str, vector: np.ndarray):
+        self.entries[key] = vector
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+class CachedEmbeddings(Embeddings):
+    """
+    Memoizes embed_query / embed_documents of another embeddings object in memory.
+
+    Vectors are kept as float32 arrays in two bounded LRUs (queries and
+    documents are encoded differently by some models), keyed by the sha256 of
+    the text. embed_documents only sends cache misses to the model, as one
+    batch. Exposes model_name of the wrapped model so index configs and
+    persistent cache keys are unchanged.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_queries: int = 4096, max_documents: int = 16384):
+        self.embeddings = embeddings
+        self.model_name = embedding_model_name(embeddings)
+        self._queries = _LRU(max_queries)
+        self._documents = _LRU(max_documents)
+        self._lock = threading.Lock()
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_sha256(text)
+        with self._lock:
+            vector = self._queries.get(key)
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            with self._lock:
+                self._queries.put(key, vector)
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_sha256(t) for t in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                vector = self._documents.get(key)
+                if vector is not None:
+                    vectors[key] = vector
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            with self._lock:
+                for key, vector in zip(missing, computed):
+                    vectors[key] = np.asarray(vector, dtype=np.float32)
+                    self._documents.put(key, vectors[key])
+        return [vectors[key].tolist() for key in keys]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"queries": self._queries.stats(), "documents": self._documents.stats()}
+
+class _PendingEmbedding:
+    def __init__(self, kind: str, texts: List[str]):
+        self.kind = kind
+        self.texts = texts
+        self.submitted_at = time.perf_counter()
+        self.done = threading.Event()
+        self.vectors: Optional[List[List[float]]] = None
+        self.error: Optional[BaseException] = None
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Dynamic micro-batching in front of a shared embeddings model.
+
+    Concurrent embed_query / embed_documents calls are queued; a single worker
+    thread takes the first waiting call, keeps collecting for up to max_wait_ms
+    or until max_batch_size texts are gathered, runs them as one
+    embed_documents forward pass and hands each caller its own slice. Queries
+    join the document batch only when the model encodes queries and documents
+    the same way; otherwise each is embedded with embed_query. Calls that are
+    already max_batch_size texts or larger bypass the queue.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.model_name = embedding_model_name(embeddings)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.queries_batchable = not getattr(embeddings, "query_encode_kwargs", None)
+        self._queue: "queue.Queue[_PendingEmbedding]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.batched_texts = 0
+        self.bypassed_calls = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.waited_calls = 0
+        self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._worker.start()
+
+    def _submit(self, kind: str, texts: List[str]) -> List[List[float]]:
+        pending = _PendingEmbedding(kind, texts)
+        self._queue.put(pending)
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit("query", [text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if len(texts) >= self.max_batch_size:
+            with self._lock:
+                self.bypassed_calls += 1
+            return self.embeddings.embed_documents(texts)
+        return self._submit("documents", list(texts))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0].texts)
+            deadline = time.perf_counter() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    pending = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                size += len(pending.texts)
+            self._process(batch)
+
+    def _process(self, batch: List[_PendingEmbedding]):
+        started = time.perf_counter()
+        with self._lock:
+            self.batches += 1
+            self.batched_texts += sum(len(p.texts) for p in batch)
+            self.total_wait += sum(started - p.submitted_at for p in batch)
+            self.waited_calls += len(batch)
+
+        grouped = [p for p in batch if p.kind == "documents" or self.queries_batchable]
+        try:
+            vectors = self.embeddings.embed_documents([t for p in grouped for t in p.texts]) if grouped else []
+            offset = 0
+            for p in grouped:
+                p.vectors = vectors[offset:offset + len(p.texts)]
+                offset += len(p.texts)
+        except BaseException as e:
+            for p in grouped:
+                p.error = e
+
+        for p in batch:
+            if p.kind == "query" and not self.queries_batchable:
+                try:
+                    p.vectors = [self.embeddings.embed_query(p.texts[0])]
+                except BaseException as e:
+                    p.error = e
+            p.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "batches": self.batches,
+                "batched_texts": self.batched_texts,
+                "mean_batch_size": round(self.batched_texts / self.batches, 2) if self.batches else 0.0,
+                "mean_queue_wait_ms": round(self.total_wait / self.waited_calls * 1000, 2) if self.waited_calls else 0.0,
+                "bypassed_calls": self.bypassed_calls,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000
+            }
+
 class Embedder:
-    def __init__(self, model_name: str = "sentence-transformers/all-mpnet-base-v2"):
-        self.emb = HuggingFaceEmbeddings(model=model_name)
+    def __init__(self, model_name: str = "sentence-transformers/all-mpnet-base-v2", backend: str = EMBED_BACKEND):
+        if backend == "onnx-int8":
+            self.emb = onnx_int8_embeddings(model_name, quantization=EMBED_ONNX_QUANTIZATION, export_dir=EMBED_ONNX_DIR)
+        elif backend == "torch":
+            self.emb = HuggingFaceEmbeddings(model=model_name)
+        else:
+            raise ValueError(f"Unknown embedding backend: {backend} (expected 'torch' or 'onnx-int8')")
+        self.batcher = None
+        self.memo = None
+        if EMBED_BATCHING_ENABLED:
+            self.emb = self.batcher = BatchingEmbeddings(self.emb, max_batch_size=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS)
+        if EMBED_MEMO_ENABLED:
+            self.emb = self.memo = CachedEmbeddings(self.emb, max_queries=EMBED_MEMO_MAX_QUERIES, max_documents=EMBED_MEMO_MAX_DOCUMENTS)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memo": self.memo.stats() if self.memo else None,
+            "batching": self.batcher.stats() if self.batcher else None
+        }
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def embedding_model_name(embedding) -> str:
+    """
+    Best-effort model identifier for an embeddings object, used to scope cache keys and index configs.
+
+    A model run on a sentence-transformers backend other than torch gets the
+    backend and model file appended (e.g. "...#onnx-qint8_avx512_vnni"),
+    since a quantized model's vectors differ from the torch model's.
+    """
+    name = type(embedding).__name__
+    for attr in ("model_name", "model"):
+        value = getattr(embedding, attr, None)
+        if isinstance(value, str) and value:
+            name = value
+            break
+    model_kwargs = getattr(embedding, "model_kwargs", None)
+    if isinstance(model_kwargs, dict) and model_kwargs.get("backend", "torch") != "torch":
+        file_name = (model_kwargs.get("model_kwargs") or {}).get("file_name", "")
+        variant = os.path.splitext(os.path.basename(file_name))[0].removeprefix("model_")
+        name += f"#{model_kwargs['backend']}" + (f"-{variant}" if variant else "")
+    return name
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of document embeddings.
+
+    Vectors are stored in SQLite keyed by (embedding model name, sha256 of the
+    text), so re-ingesting the same chunks costs a lookup instead of a forward
+    pass, even after the user's vector DB has been wiped. The cache is bounded
+    to max_entries and evicts the least recently used vectors.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        if not hashes:
+            return found
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                    [model, *part]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes(), now) for h, v in items.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Trim to 90% so eviction doesn't run on every insert at the limit
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        print(f"Embedding cache evicted {excess} least recently used entries")
+
+    def embed_documents(self, embedding, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """Embed texts, reusing cached vectors and only running the model on misses."""
+        model = model or embedding_model_name(embedding)
+        hashes = [text_sha256(t) for t in texts]
+        vectors = self.get_many(model, hashes)
+
+        missing: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in vectors:
+                missing.setdefault(h, t)
+
+        hit_count = sum(1 for h in hashes if h in vectors)
+        with self._lock:
+            self.hits += hit_count
+            self.misses += len(texts) - hit_count
+
+        if missing:
+            computed = embedding.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), computed))
+            self.put_many(model, new_items)
+            vectors.update(new_items)
+
+        return [vectors[h] for h in hashes]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
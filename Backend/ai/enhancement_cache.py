@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    return WHITESPACE.sub(" ", question).strip().rstrip("?!. ").lower()
+
+
+class EnhancementCache:
+    """
+    In-process LRU + TTL cache of query enhancement (expansion/decomposition) outputs.
+
+    Entries are keyed by (LLM model name, enhancement mode, normalized
+    question) and expire ttl seconds after they were stored. When path is set
+    the cache is loaded from and written back to a JSON file, so FAQ-style
+    questions stay warm across restarts. put only marks the cache dirty; a
+    background thread writes a snapshot of the entries at most every
+    flush_interval seconds, and once more at exit, so lookups never wait on
+    disk I/O.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 24 * 3600, path: Optional[str] = None, flush_interval: float = 5.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.path = path
+        self.flush_interval = max(0.1, flush_interval)
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.flushes = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._closed = threading.Event()
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[str, float]]" = OrderedDict()
+        self._load()
+        self._flusher = None
+        if self.path:
+            self._flusher = threading.Thread(target=self._flush_loop, name="enhancement-cache-flush", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+            now = time.time()
+            for model, mode, question, value, stored_at in rows[-self.max_entries:]:
+                if now - stored_at < self.ttl:
+                    self._entries[(model, mode, question)] = (value, stored_at)
+        except Exception as e:
+            print(f"Warning: Could not load enhancement cache from {self.path}: {e}")
+            self._entries.clear()
+
+    def _save(self, rows):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rows, f)
+        os.replace(tmp, self.path)
+
+    def flush(self):
+        """Write the entries to path if anything changed since the last write."""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                rows = [[*key, value, stored_at] for key, (value, stored_at) in self._entries.items()]
+                self._dirty = False
+            try:
+                self._save(rows)
+                self.flushes += 1
+            except Exception as e:
+                with self._lock:
+                    self._dirty = True
+                print(f"Warning: Could not persist enhancement cache to {self.path}: {e}")
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Stop the background writer and write any pending entries."""
+        self._closed.set()
+        if self._flusher and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.flush()
+
+    def get(self, model: str, mode: str, question: str) -> Optional[str]:
+        key = (model, mode, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry[1] >= self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, model: str, mode: str, question: str, value: str):
+        key = (model, mode, normalize_question(question))
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "flushes": self.flushes,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,217 @@
+import os
+import json
+import shutil
+import threading
+import time
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    m = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+
+class FlatIndex:
+    """
+    Exact dense index kept as one normalized embedding matrix.
+
+    Meant for small per-user corpora (a few thousand chunks), where exact
+    search is a single matrix multiply and an HNSW graph plus a SQLite
+    metadata store is more machinery than the data needs. Embeddings are
+    saved as embeddings.npy (float32 or float16) and memory-mapped on open;
+    ids, texts and metadata live in docs.json next to it.
+
+    Implements the subset of the Chroma collection API that VectorDB uses
+    (count, upsert, get, query, delete), with equality and $and where
+    clauses. Distances are cosine distances. Changes are held in memory
+    until save(), which writes both files into a new generation directory
+    and then switches the CURRENT pointer file to it, so a crash mid-save
+    never pairs a matrix with the documents of another save. If the saved
+    index cannot be loaded, it opens empty with load_failed set.
+    """
+
+    CURRENT = "CURRENT"
+
+    def __init__(self, directory: str, dtype: str = "float32"):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.RLock()
+        self.load_failed = False
+        self._clear()
+        self._load()
+
+    def _clear(self):
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self._stored: Optional[np.ndarray] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._positions: Dict[str, int] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+
+    @property
+    def exists(self) -> bool:
+        return self._current_dir() is not None
+
+    def _current_dir(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directory, self.CURRENT), "r", encoding="utf-8") as f:
+                return os.path.join(self.directory, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        current = self._current_dir()
+        if current is None:
+            return
+        try:
+            with open(os.path.join(current, "docs.json"), "r", encoding="utf-8") as f:
+                docs = json.load(f)
+            self.ids, self.documents, self.metadatas = docs["ids"], docs["documents"], docs["metadatas"]
+            self._stored = np.load(os.path.join(current, "embeddings.npy"), mmap_mode="r")
+            if not (self._stored.ndim == 2 and len(self._stored) == len(self.ids) == len(self.documents) == len(self.metadatas)):
+                raise ValueError("index files do not belong together")
+            self._positions = {i: n for n, i in enumerate(self.ids)}
+        except Exception as e:
+            print(f"Warning: Could not load flat index from {self.directory}: {e}")
+            self._clear()
+            self.load_failed = True
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            generation = f"gen-{time.time_ns()}"
+            tmp_dir = os.path.join(self.directory, generation + ".tmp")
+            os.makedirs(tmp_dir)
+            with open(os.path.join(tmp_dir, "embeddings.npy"), "wb") as f:
+                np.save(f, np.ascontiguousarray(self._vectors().astype(self.dtype, copy=False)))
+            with open(os.path.join(tmp_dir, "docs.json"), "w", encoding="utf-8") as f:
+                json.dump({"ids": self.ids, "documents": self.documents, "metadatas": self.metadatas}, f)
+            os.replace(tmp_dir, os.path.join(self.directory, generation))
+
+            pointer = os.path.join(self.directory, self.CURRENT + ".tmp")
+            with open(pointer, "w", encoding="utf-8") as f:
+                f.write(generation)
+            os.replace(pointer, os.path.join(self.directory, self.CURRENT))
+            self.load_failed = False
+            # Older generations (and leftovers of an interrupted save) are no longer referenced
+            for name in os.listdir(self.directory):
+                if name.startswith("gen-") and name != generation:
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _vectors(self) -> np.ndarray:
+        """The embedding matrix as float32; a float32 file stays memory-mapped."""
+        if self._matrix is None:
+            if self._stored is None:
+                return np.zeros((0, 0), dtype=np.float32)
+            self._matrix = self._stored if self._stored.dtype == np.float32 else np.asarray(self._stored, dtype=np.float32)
+        return self._matrix
+
+    def _set(self, keep: np.ndarray, new_ids, new_vectors, new_documents, new_metadatas):
+        old = self._vectors()
+        parts = [old[keep]] if len(old) else []
+        if len(new_ids):
+            parts.append(new_vectors)
+        self._matrix = np.concatenate(parts) if parts else None
+        self._stored = self._matrix
+        self.ids = [i for i, k in zip(self.ids, keep) if k] + list(new_ids)
+        self.documents = [d for d, k in zip(self.documents, keep) if k] + list(new_documents)
+        self.metadatas = [m for m, k in zip(self.metadatas, keep) if k] + [dict(m or {}) for m in new_metadatas]
+        self._positions = {i: n for n, i in enumerate(self.ids)}
+        self._columns = {}
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def upsert(self, ids: List[str], embeddings, metadatas: List[Dict[str, Any]], documents: List[str]):
+        with self._lock:
+            replaced = set(ids)
+            keep = np.array([i not in replaced for i in self.ids], dtype=bool)
+            self._set(keep, ids, normalize_rows(embeddings), documents, metadatas)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            remove = self._where_mask(where) if where else np.zeros(len(self.ids), dtype=bool)
+            for i in ids or []:
+                if i in self._positions:
+                    remove[self._positions[i]] = True
+            if remove.any():
+                self._set(~remove, [], None, [], [])
+
+    def _column(self, key: str) -> np.ndarray:
+        col = self._columns.get(key)
+        if col is None:
+            col = np.array([m.get(key) for m in self.metadatas], dtype=object)
+            self._columns[key] = col
+        return col
+
+    def _where_mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, value in (where or {}).items():
+            if key == "$and":
+                for clause in value:
+                    mask &= self._where_mask(clause)
+            elif isinstance(value, dict) and "$eq" in value:
+                mask &= self._column(key) == value["$eq"]
+            else:
+                mask &= self._column(key) == value
+        return mask
+
+    def _result(self, positions: Sequence[int], include: Sequence[str]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"ids": [self.ids[p] for p in positions]}
+        if "documents" in include:
+            result["documents"] = [self.documents[p] for p in positions]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[p] for p in positions]
+        if "embeddings" in include:
+            result["embeddings"] = self._vectors()[list(positions)] if len(positions) else np.zeros((0, 0), dtype=np.float32)
+        return result
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        with self._lock:
+            if ids is not None:
+                positions = [self._positions[i] for i in ids if i in self._positions]
+                if where:
+                    mask = self._where_mask(where)
+                    positions = [p for p in positions if mask[p]]
+            else:
+                positions = np.flatnonzero(self._where_mask(where)).tolist()
+            start = offset or 0
+            positions = positions[start:start + limit] if limit is not None else positions[start:]
+            return self._result(positions, include)
+
+    def _scores(self, query_embeddings, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        scores = normalize_rows(query_embeddings) @ self._vectors().T
+        if where:
+            scores[:, ~self._where_mask(where)] = -np.inf
+        return scores
+
+    def query(self, query_embeddings, n_results: int = 4, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> Dict[str, Any]:
+        """Exact cosine top-k for each query embedding, in Chroma's nested result layout."""
+        with self._lock:
+            out: Dict[str, List[Any]] = {"ids": []}
+            for name in ("documents", "metadatas", "embeddings", "distances"):
+                if name in include:
+                    out[name] = []
+            if not self.ids:
+                for values in out.values():
+                    values.extend([] for _ in range(len(query_embeddings)))
+                return out
+
+            scores = self._scores(query_embeddings, where)
+            for row in scores:
+                valid = np.flatnonzero(np.isfinite(row))
+                top = valid
+                if len(valid) > n_results:
+                    top = valid[np.argpartition(-row[valid], n_results - 1)[:n_results]]
+                top = top[np.argsort(-row[top], kind="stable")]
+                result = self._result(top.tolist(), include)
+                for name, values in result.items():
+                    out[name].append(values)
+                if "distances" in include:
+                    out["distances"].append((1.0 - row[top]).tolist())
+            return out
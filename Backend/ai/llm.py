@@ -8,4 +8,5 @@ if os.getenv("GROQ_API_KEY"):
 
 class LLM:
     def __init__(self, model_name: str):
+        self.model_name = model_name
         self.llm = init_chat_model(model=model_name)
\ No newline at end of file
@@ -1,6 +1,7 @@
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough, RunnableParallel
+from langchain_core.runnables import RunnableLambda, RunnableParallel
 from langchain_core.prompts import ChatPromptTemplate
+from ai.constant import *
 
 custom_prompt = ChatPromptTemplate.from_template("""Use the following context to answer the question. 
 If you don't know the answer based on the context, say you don't know.
@@ -14,30 +15,152 @@ Question: {question}
 Answer:""")
 
 
-def format_docs(docs):
+def format_docs_verbatim(docs):
     return "\n\n".join(
         f"[file={d.metadata.get('filename')} page={d.metadata.get('page')} doc_id={d.metadata.get('doc_id')} chunk_id={d.metadata.get('chunk_id')}]\n{d.page_content}"
         for d in docs
     )
 
-def build_rag_chain(llm_obj, retriever):
-    def get_docs(q: str):
-        return retriever.invoke(q)
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def _overlap_length(left: str, right: str, max_overlap: int) -> int:
+    """Length of the longest suffix of left that is also a prefix of right (0 if shorter than MIN_MERGE_OVERLAP)."""
+    for k in range(min(len(left), len(right), max_overlap), MIN_MERGE_OVERLAP - 1, -1):
+        if left.endswith(right[:k]):
+            return k
+    return 0
+
+def _merge_blocks(chunks):
+    """
+    Group selected chunks into blocks in page order. Chunks with consecutive
+    chunk_index values from the same doc_id share a block, with the repeated
+    splitter overlap removed; a truncated chunk always stands alone.
+    """
+    def position(c):
+        index = c["doc"].metadata.get("chunk_index")
+        return (str(c["doc"].metadata.get("doc_id")), index if isinstance(index, int) else float("inf"), c["rank"])
+
+    blocks = []
+    for c in sorted(chunks, key=position):
+        meta = c["doc"].metadata
+        index = meta.get("chunk_index")
+        last = blocks[-1] if blocks else None
+        if (last and not c["truncated"] and not last["truncated"] and isinstance(index, int)
+                and last["doc_id"] == meta.get("doc_id") and last["last_index"] is not None
+                and index == last["last_index"] + 1):
+            overlap = _overlap_length(last["text"], c["text"], MAX_MERGE_OVERLAP)
+            last["text"] += c["text"][overlap:] if overlap else "\n" + c["text"]
+            last["last_index"] = index
+            last["last_page"] = meta.get("page")
+            last["chunk_ids"].append(meta.get("chunk_id"))
+            last["overlap_chars"] += overlap
+            continue
+        blocks.append({
+            "doc_id": meta.get("doc_id"),
+            "filename": meta.get("filename"),
+            "first_page": meta.get("page"),
+            "last_page": meta.get("page"),
+            "last_index": index if isinstance(index, int) else None,
+            "chunk_ids": [meta.get("chunk_id")],
+            "text": c["text"],
+            "truncated": c["truncated"],
+            "overlap_chars": 0,
+        })
+    return blocks
+
+def _block_text(b) -> str:
+    pages = b["first_page"] if b["first_page"] == b["last_page"] else f"{b['first_page']}-{b['last_page']}"
+    return f"[file={b['filename']} page={pages} doc_id={b['doc_id']} chunk_id={','.join(str(c) for c in b['chunk_ids'])}]\n{b['text']}"
+
+def _packed_tokens(blocks) -> int:
+    return sum(estimate_tokens(_block_text(b)) + 1 for b in blocks)
+
+def pack_context(docs, token_budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Assemble retrieved chunks into prompt context.
 
+    Chunks are chosen in retrieval-rank order while the packed context still
+    fits token_budget; the first one that doesn't fit whole may be truncated
+    to the remaining budget if that leaves at least MIN_TRUNCATED_BLOCK_TOKENS.
+    Only then are the chosen chunks merged (see _merge_blocks), so every
+    chunk_id and page in a block header has its text in the context.
+
+    Returns:
+        (context text, stats dict with token counts before/after packing)
+    """
+    ranked = []
+    seen = set()
+    for rank, d in enumerate(docs):
+        key = d.metadata.get("chunk_id") or id(d)
+        if key not in seen:
+            seen.add(key)
+            ranked.append({"rank": rank, "doc": d, "text": d.page_content, "truncated": False})
+
+    # Spend the budget on the most relevant chunks first
+    chosen = []
+    tokens_truncated = 0
+    for c in ranked:
+        if _packed_tokens(_merge_blocks(chosen + [c])) <= token_budget:
+            chosen.append(c)
+            continue
+        c = dict(c, truncated=True)
+        remaining = token_budget - _packed_tokens(_merge_blocks(chosen)) - _packed_tokens(_merge_blocks([dict(c, text="")]))
+        if remaining >= MIN_TRUNCATED_BLOCK_TOKENS:
+            c["text"] = c["text"][:remaining * CHARS_PER_TOKEN]
+            tokens_truncated = estimate_tokens(c["doc"].page_content) - estimate_tokens(c["text"])
+            chosen.append(c)
+            break
+
+    blocks = _merge_blocks(chosen)
+    context = "\n\n".join(_block_text(b) for b in blocks)
+    chosen_ids = {id(c["doc"]) for c in chosen}
+    dropped = [c["doc"] for c in ranked if id(c["doc"]) not in chosen_ids]
+    tokens_before = estimate_tokens(format_docs_verbatim(docs))
+    tokens_after = estimate_tokens(context)
+    tokens_dropped = estimate_tokens(format_docs_verbatim(dropped))
+    stats = {
+        "chunks_in": len(docs),
+        "blocks_out": len(blocks),
+        "chunks_merged": sum(len(b["chunk_ids"]) - 1 for b in blocks),
+        "overlap_chars_removed": sum(b["overlap_chars"] for b in blocks),
+        "chunks_dropped": len(dropped),
+        "chunks_truncated": sum(c["truncated"] for c in chosen),
+        "token_budget": token_budget,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_dropped": tokens_dropped,
+        "tokens_truncated": tokens_truncated,
+        # What deduplication and overlap removal saved, not counting dropped or cut text
+        "tokens_saved": max(0, tokens_before - tokens_after - tokens_dropped - tokens_truncated),
+    }
+    return context, stats
+
+def format_docs(docs):
+    return pack_context(docs)[0]
+
+def build_answer_chain(llm_obj):
+    """Prompt -> LLM -> text, taking {"context", "question"}. Supports .stream() for token output."""
+    return custom_prompt | llm_obj.llm | StrOutputParser()
+
+def build_rag_chain(llm_obj, retriever):
+    """
+    Build the answer chain. Retrieval and context packing run once per question
+    and the result is shared by the answer, context_docs, context_text and
+    context_stats outputs.
+    """
     def get_context(q: str):
-        docs = get_docs(q)
-        return {"docs": docs, "context": format_docs(docs), "question": q}
+        docs = retriever.invoke(q)
+        context, stats = pack_context(docs)
+        return {"docs": docs, "context": context, "context_stats": stats, "question": q}
 
-    chain = RunnableParallel(
+    chain = RunnableLambda(get_context) | RunnableParallel(
         answer=(
-            RunnablePassthrough()
-            | get_context
-            | (lambda x: {"context": x["context"], "question": x["question"]})
-            | custom_prompt
-            | llm_obj.llm
-            | StrOutputParser()
+            (lambda x: {"context": x["context"], "question": x["question"]})
+            | build_answer_chain(llm_obj)
         ),
-        context_docs=RunnablePassthrough() | get_context | (lambda x: x["docs"]),
-        context_text=RunnablePassthrough() | get_context | (lambda x: x["context"]),
+        context_docs=lambda x: x["docs"],
+        context_text=lambda x: x["context"],
+        context_stats=lambda x: x["context_stats"],
     )
-    return chain
\ No newline at end of file
+    return chain
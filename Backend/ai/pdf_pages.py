@@ -0,0 +1,104 @@
+import os
+import pickle
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Same normalization of the PDF info dictionary as langchain_community's PDF
+# parsers apply, kept here so pages match PyPDFLoader without relying on its
+# private helpers.
+_RENAMED_KEYS = {"page_count": "total_pages", "file_path": "source"}
+_DATE_KEYS = ("creationdate", "moddate")
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pdf_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Lower-case the keys of a PDF info dictionary and normalize dates and values."""
+    cleaned: Dict[str, Any] = {}
+    for key, value in metadata.items():
+        if type(value) not in (str, int):
+            value = str(value)
+        key = (key[1:] if key.startswith("/") else key).lower()
+        if key in _DATE_KEYS:
+            try:
+                cleaned[key] = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                cleaned[key] = value
+        elif key in _RENAMED_KEYS:
+            cleaned[_RENAMED_KEYS[key]] = value
+            cleaned[key] = value
+        elif isinstance(value, str):
+            cleaned[key] = value.strip()
+        else:
+            cleaned[key] = value
+    return cleaned
+
+
+def extract_pdf_pages(path: str, source: str, start: int, stop: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Text and metadata of pages [start, stop) of a PDF.
+
+    Built the same way PyPDFLoader builds its documents, so pages (and the
+    chunk ids derived from them) match a sequential load exactly.
+    """
+    import pypdf
+
+    reader = pypdf.PdfReader(path)
+    doc_metadata = pdf_metadata(
+        {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+        | dict(reader.metadata or {})
+        | {"source": source, "total_pages": len(reader.pages)}
+    )
+    page_labels = reader.page_labels
+    pages = []
+    for page_number in range(start, stop):
+        text = reader.pages[page_number].extract_text(extraction_mode="plain")
+        pages.append((text.strip(), doc_metadata | {"page": page_number, "page_label": page_labels[page_number]}))
+    return pages
+
+
+def iter_pages_parallel(path: str, source: str, ranges: List[Tuple[int, int]], workers: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Extract page ranges in `workers` worker interpreters and yield pages in order.
+
+    Workers are fresh `python -m ai.pdf_pages` processes rather than forks of
+    the server: ingest runs next to Flask, Chroma, embedding and model
+    threads, and a forked child inherits their locks in whatever state they
+    were in. multiprocessing's spawn and forkserver workers would avoid that
+    too, but re-import the main module (the whole backend, about half a GB
+    per worker); these only import pypdf. Worker i gets ranges i, i +
+    workers, ... and writes one pickled list of pages per range to stdout.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_PACKAGE_ROOT, os.environ.get("PYTHONPATH")])))
+    procs = []
+    try:
+        for w in range(workers):
+            args = [f"{start}:{stop}" for start, stop in ranges[w::workers]]
+            procs.append(subprocess.Popen([sys.executable, "-m", "ai.pdf_pages", path, source, *args], stdout=subprocess.PIPE, env=env))
+        for i in range(len(ranges)):
+            proc = procs[i % workers]
+            try:
+                pages = pickle.load(proc.stdout)
+            except EOFError:
+                raise RuntimeError(f"PDF extraction worker exited with code {proc.wait()} on pages {ranges[i][0]}-{ranges[i][1] - 1}")
+            yield from pages
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            proc.stdout.close()
+
+
+def main(argv: List[str]):
+    path, source, *ranges = argv
+    out = sys.stdout.buffer
+    for r in ranges:
+        start, stop = map(int, r.split(":"))
+        pickle.dump(extract_pdf_pages(path, source, start, stop), out)
+        out.flush()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
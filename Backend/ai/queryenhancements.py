@@ -1,5 +1,40 @@
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+import re
+from ai.sparse_index import tokenize
+
+LIST_MARKER = re.compile(r"^\s*(?:[-*\u2022]|\(?\d+[.):]|sub-question\s*\d*[.:]?|q\d+[.:])\s*", re.IGNORECASE)
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how in is it its of on or that the this to was were what when where which who why will with
+""".split())
+
+def novel_terms(question, query):
+    """Terms of query that are not already in question (nor stopwords), in order, as a search string."""
+    seen = set(tokenize(question)) | STOPWORDS
+    terms = []
+    for token in tokenize(query):
+        if token not in seen:
+            seen.add(token)
+            terms.append(token)
+    return " ".join(terms)
+
+def parse_sub_queries(text, max_queries=4):
+    """
+    Split an LLM decomposition/expansion response into individual queries.
+
+    Each non-empty line becomes a query once list markers ("1.", "-", "Sub-question 2:")
+    and surrounding quotes are stripped. Preamble lines ending with ":" are skipped.
+    A response without line structure comes back as a single query.
+    """
+    queries = []
+    for line in text.splitlines():
+        line = LIST_MARKER.sub("", line).strip().strip('"').strip()
+        if len(line) < 3 or line.endswith(":"):
+            continue
+        if line.lower() not in (q.lower() for q in queries):
+            queries.append(line)
+    return queries[:max_queries] or ([text.strip()] if text.strip() else [])
 
 class queryDecompose:
     def __init__(self):
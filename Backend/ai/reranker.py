@@ -1,4 +1,6 @@
-from typing import List
+import threading
+import time
+from typing import Any, Dict, List
 from flashrank import Ranker, RerankRequest
 from sentence_transformers import CrossEncoder
 from langchain_core.documents import Document
@@ -6,6 +8,9 @@ from langchain_core.documents import Document
 class Reranker:
     def __init__(self, reranker_type: str = "flashrank"):
         self.reranker_type = reranker_type
+        # HF tokenizers are not safe for concurrent use, so each instance serializes
+        # its own scoring; different models still score in parallel
+        self._predict_lock = threading.Lock()
         if reranker_type == "cross_encoder":
             self.reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
         elif reranker_type == "bge":
@@ -20,13 +25,61 @@ class Reranker:
             return docs[:top_k]
         if self.reranker_type in ["cross_encoder", "bge"]:
             pairs = [(question, doc.page_content) for doc in docs]
-            scores = self.reranker.predict(pairs)
+            with self._predict_lock:
+                scores = self.reranker.predict(pairs)
             scored_docs = list(zip(docs, scores))
             scored_docs.sort(key=lambda x: x[1], reverse=True)
             return [doc for doc, score in scored_docs[:top_k]]
         elif self.reranker_type == "flashrank":
             passages = [{"id": i, "text": doc.page_content} for i, doc in enumerate(docs)]
             request = RerankRequest(query=question, passages=passages)
-            results = self.reranker.rerank(request)
+            with self._predict_lock:
+                results = self.reranker.rerank(request)
             return [docs[r['id']] for r in results[:top_k]]
-        return docs[:top_k]
\ No newline at end of file
+        return docs[:top_k]
+
+class RerankerRegistry:
+    """
+    Process-wide registry of loaded rerankers.
+
+    Each reranker type is loaded once (the default at startup, others on
+    first use), warmed up with a dummy batch and then shared by all requests.
+    The registry only locks while a type is loading; scoring is serialized
+    per Reranker instance, never across models.
+    """
+
+    def __init__(self):
+        self._rerankers: Dict[str, Reranker] = {}
+        self._load_times: Dict[str, float] = {}
+        self._type_locks_lock = threading.Lock()
+        self._type_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, reranker_type: str) -> Reranker:
+        reranker = self._rerankers.get(reranker_type)
+        if reranker is not None:
+            return reranker
+        with self._type_locks_lock:
+            type_lock = self._type_locks.setdefault(reranker_type, threading.Lock())
+        # Only requests for the same type wait while it loads
+        with type_lock:
+            reranker = self._rerankers.get(reranker_type)
+            if reranker is None:
+                start = time.perf_counter()
+                reranker = Reranker(reranker_type=reranker_type)
+                reranker.rerank_docs("warm up", [Document(page_content="warm up batch"), Document(page_content="second document")], top_k=1)
+                self._load_times[reranker_type] = time.perf_counter() - start
+                self._rerankers[reranker_type] = reranker
+                print(f"Loaded reranker {reranker_type} in {self._load_times[reranker_type]:.2f}s")
+        return reranker
+
+    def preload(self, reranker_type: str):
+        try:
+            self.get(reranker_type)
+        except Exception as e:
+            print(f"Warning: Could not preload reranker {reranker_type}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": sorted(self._rerankers),
+            "load_seconds": {k: round(v, 3) for k, v in self._load_times.items()}
+        }
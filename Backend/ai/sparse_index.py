@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import shutil
+import threading
+import time
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Persistent BM25 (Okapi) index over the chunks of one vector store.
+
+    Postings are kept in CSR form, grouped by term: for term t, entries
+    term_ptr[t]:term_ptr[t+1] of post_docs / post_tfs hold the documents that
+    contain t and its frequency in each. Together with per-document token
+    counts these arrays are saved as .npy files and memory-mapped on load, so
+    opening the index doesn't re-tokenize anything and a query only touches
+    the postings of its own terms.
+
+    add() only tokenizes the new documents and buffers their postings; the
+    buffer is merged into the CSR arrays once, by the next save, remove or
+    search, so streaming a file in many batches costs one merge rather than
+    one full rebuild per batch. The merge inserts the new postings at the end
+    of each term's span (they belong to the newest documents) without
+    re-sorting the existing ones. remove() still rebuilds the arrays.
+    Scoring matches rank_bm25.BM25Okapi, including its epsilon floor for
+    negative idf.
+
+    Each save writes a complete new generation directory and then switches
+    the CURRENT pointer file to it with one os.replace, so a crash mid-save
+    leaves the previous generation in use rather than a mix of old and new
+    files.
+    """
+
+    FILES = ("term_ptr.npy", "post_docs.npy", "post_tfs.npy", "doc_lens.npy")
+    CURRENT = "CURRENT"
+
+    def __init__(self, directory: str, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self._lock = threading.RLock()
+        self._clear()
+        self._load()
+
+    def _clear(self):
+        self.vocab: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.term_ptr = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.zeros(0, dtype=np.int32)
+        self.post_tfs = np.zeros(0, dtype=np.float32)
+        self.doc_lens = np.zeros(0, dtype=np.float32)
+        self._idf: Optional[np.ndarray] = None
+        self._columns: Dict[str, np.ndarray] = {}
+        self._id_set = set()
+        self._pending_terms: List[np.ndarray] = []
+        self._pending_docs: List[np.ndarray] = []
+        self._pending_tfs: List[np.ndarray] = []
+        self._pending_lens: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def exists(self) -> bool:
+        return self._current_dir() is not None
+
+    def _current_dir(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directory, self.CURRENT), "r", encoding="utf-8") as f:
+                return os.path.join(self.directory, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        current = self._current_dir()
+        if current is None:
+            return
+        try:
+            with open(os.path.join(current, "vocab.json"), "r", encoding="utf-8") as f:
+                self.vocab = json.load(f)
+            with open(os.path.join(current, "docs.json"), "r", encoding="utf-8") as f:
+                docs = json.load(f)
+            self.ids = docs["ids"]
+            self.metadatas = docs["metadatas"]
+            self.term_ptr, self.post_docs, self.post_tfs, self.doc_lens = (
+                np.load(os.path.join(current, name), mmap_mode="r") for name in self.FILES
+            )
+            if not (len(self.term_ptr) == len(self.vocab) + 1
+                    and len(self.post_docs) == len(self.post_tfs) == int(self.term_ptr[-1])
+                    and len(self.doc_lens) == len(self.ids) == len(self.metadatas)):
+                raise ValueError("index files do not belong together")
+            self._id_set = set(self.ids)
+        except Exception as e:
+            print(f"Warning: Could not load BM25 index from {self.directory}: {e}")
+            self._clear()
+
+    def save(self):
+        with self._lock:
+            self._compact()
+            os.makedirs(self.directory, exist_ok=True)
+            generation = f"gen-{time.time_ns()}"
+            tmp_dir = os.path.join(self.directory, generation + ".tmp")
+            os.makedirs(tmp_dir)
+            arrays = (self.term_ptr, self.post_docs, self.post_tfs, self.doc_lens)
+            for name, arr in zip(self.FILES, arrays):
+                with open(os.path.join(tmp_dir, name), "wb") as f:
+                    np.save(f, np.ascontiguousarray(arr))
+            for name, data in (("vocab.json", self.vocab), ("docs.json", {"ids": self.ids, "metadatas": self.metadatas})):
+                with open(os.path.join(tmp_dir, name), "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+            os.replace(tmp_dir, os.path.join(self.directory, generation))
+
+            pointer = os.path.join(self.directory, self.CURRENT + ".tmp")
+            with open(pointer, "w", encoding="utf-8") as f:
+                f.write(generation)
+            os.replace(pointer, os.path.join(self.directory, self.CURRENT))
+            # Older generations (and leftovers of an interrupted save) are no longer referenced
+            for name in os.listdir(self.directory):
+                if name.startswith("gen-") and name != generation:
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _set_postings(self, term_ids: np.ndarray, doc_idx: np.ndarray, tfs: np.ndarray):
+        order = np.argsort(term_ids, kind="stable")
+        counts = np.bincount(term_ids, minlength=len(self.vocab))
+        self.term_ptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.post_docs = doc_idx[order].astype(np.int32)
+        self.post_tfs = tfs[order].astype(np.float32)
+        self._idf = None
+        self._columns = {}
+
+    def _posting_terms(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self.term_ptr) - 1, dtype=np.int64), np.diff(self.term_ptr))
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        """Add (or replace) documents. Replaced ids are removed first."""
+        with self._lock:
+            existing = self._id_set.intersection(ids)
+            if existing:
+                self._remove_mask(np.array([i in existing for i in self.ids], dtype=bool))
+
+            base = len(self.ids)
+            for offset, text in enumerate(texts):
+                tokens = tokenize(text)
+                self._pending_lens.append(len(tokens))
+                if not tokens:
+                    continue
+                term_ids = np.fromiter((self.vocab.setdefault(t, len(self.vocab)) for t in tokens), dtype=np.int64, count=len(tokens))
+                uniq, tf = np.unique(term_ids, return_counts=True)
+                self._pending_terms.append(uniq)
+                self._pending_docs.append(np.full(len(uniq), base + offset, dtype=np.int64))
+                self._pending_tfs.append(tf.astype(np.float32))
+
+            self.ids.extend(ids)
+            self._id_set.update(ids)
+            self.metadatas.extend(dict(m) for m in metadatas)
+            self._idf = None
+            self._columns = {}
+
+    def _compact(self):
+        """Merge the postings buffered by add() into the CSR arrays."""
+        if not self._pending_lens:
+            return
+        self.doc_lens = np.concatenate((np.asarray(self.doc_lens), np.asarray(self._pending_lens, dtype=np.float32)))
+        if self._pending_terms:
+            terms = np.concatenate(self._pending_terms)
+            order = np.argsort(terms, kind="stable")
+            terms = terms[order]
+            term_ptr = np.concatenate((self.term_ptr, np.full(len(self.vocab) + 1 - len(self.term_ptr), self.term_ptr[-1])))
+            # Each new posting goes after the existing postings of its term
+            at = term_ptr[terms + 1]
+            self.post_docs = np.insert(np.asarray(self.post_docs), at, np.concatenate(self._pending_docs)[order].astype(np.int32))
+            self.post_tfs = np.insert(np.asarray(self.post_tfs), at, np.concatenate(self._pending_tfs)[order])
+            added = np.bincount(terms, minlength=len(self.vocab))
+            self.term_ptr = term_ptr + np.concatenate(([0], np.cumsum(added)))
+        else:
+            self.term_ptr = np.concatenate((self.term_ptr, np.full(len(self.vocab) + 1 - len(self.term_ptr), self.term_ptr[-1])))
+        self._pending_terms, self._pending_docs, self._pending_tfs, self._pending_lens = [], [], [], []
+        self._idf = None
+
+    def _remove_mask(self, remove: np.ndarray):
+        self._compact()
+        keep = ~remove
+        new_index = np.cumsum(keep) - 1
+        posting_keep = keep[self.post_docs]
+        terms = self._posting_terms()[posting_keep]
+        docs = new_index[np.asarray(self.post_docs)[posting_keep]]
+        tfs = np.asarray(self.post_tfs)[posting_keep]
+        self.ids = [i for i, k in zip(self.ids, keep) if k]
+        self._id_set = set(self.ids)
+        self.metadatas = [m for m, k in zip(self.metadatas, keep) if k]
+        self.doc_lens = np.asarray(self.doc_lens)[keep]
+        self._set_postings(terms, docs, tfs)
+
+    def remove(self, where: Dict[str, Any]) -> int:
+        """Remove every document whose metadata matches all key/value pairs in where."""
+        with self._lock:
+            if not self.ids:
+                return 0
+            mask = self._filter_mask(where)
+            removed = int(mask.sum())
+            if removed:
+                self._remove_mask(mask)
+            return removed
+
+    def _column(self, key: str) -> np.ndarray:
+        col = self._columns.get(key)
+        if col is None:
+            col = np.array([m.get(key) for m in self.metadatas], dtype=object)
+            self._columns[key] = col
+        return col
+
+    def _filter_mask(self, meta_filter: Optional[Dict[str, Any]]) -> np.ndarray:
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, value in (meta_filter or {}).items():
+            mask &= self._column(key) == value
+        return mask
+
+    def _idf_vector(self) -> np.ndarray:
+        if self._idf is None:
+            n = len(self.ids)
+            df = np.diff(self.term_ptr).astype(np.float64)
+            present = df > 0
+            idf = np.log(n - df + 0.5) - np.log(df + 0.5)
+            average_idf = idf[present].mean() if present.any() else 0.0
+            idf[present & (idf < 0)] = self.epsilon * average_idf
+            idf[~present] = 0.0
+            self._idf = idf
+        return self._idf
+
+    def search(self, query: str, k: int = 4, meta_filter: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Return up to k (chunk id, BM25 score) pairs, best first."""
+        with self._lock:
+            n = len(self.ids)
+            if not n:
+                return []
+            self._compact()
+            term_ids = [self.vocab[t] for t in tokenize(query) if t in self.vocab]
+            if not term_ids:
+                return []
+
+            idf = self._idf_vector()
+            starts = self.term_ptr[term_ids]
+            ends = self.term_ptr[np.asarray(term_ids) + 1]
+            spans = [np.arange(s, e) for s, e in zip(starts, ends)]
+            positions = np.concatenate(spans)
+            term_of = np.repeat(np.asarray(term_ids), ends - starts)
+
+            docs = np.asarray(self.post_docs[positions], dtype=np.int64)
+            tfs = np.asarray(self.post_tfs[positions], dtype=np.float64)
+            avgdl = float(np.asarray(self.doc_lens).mean()) or 1.0
+            norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_lens, dtype=np.float64)[docs] / avgdl)
+            contrib = idf[term_of] * tfs * (self.k1 + 1) / (tfs + norm)
+            scores = np.bincount(docs, weights=contrib, minlength=n)
+
+            candidates = np.flatnonzero(self._filter_mask(meta_filter) & (scores > 0))
+            if not len(candidates):
+                return []
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(self.ids[i], float(scores[i])) for i in candidates]
@@ -0,0 +1,129 @@
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+import chromadb
+
+TENANT_KEY = "tenant_id"
+
+
+def tenant_shard(tenant_id: str, shards: int) -> int:
+    """Stable shard of a tenant; sha256 so it does not change between processes."""
+    return int(hashlib.sha256(tenant_id.encode("utf-8")).hexdigest()[:8], 16) % shards
+
+
+def tenant_where(tenant_id: str, where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Add the tenant clause to a Chroma where clause."""
+    clause = {TENANT_KEY: tenant_id}
+    if not where:
+        return clause
+    if len(where) == 1 and "$and" in where:
+        return {"$and": [clause, *where["$and"]]}
+    return {"$and": [clause, where]}
+
+
+class TenantCollection:
+    """
+    One tenant's view of a collection shared with other tenants.
+
+    Implements the subset of the Chroma collection API that VectorDB uses
+    (count, upsert, get, query, delete), like FlatIndex. Writes tag every
+    chunk with the tenant id in its metadata, and every read and delete
+    carries a tenant_id where clause, which Chroma applies inside the search,
+    so a tenant only ever sees and removes its own chunks. Ids are stored as
+    "<tenant>/<id>", so tenants indexing the same file do not overwrite each
+    other, and are returned without the prefix.
+    """
+
+    def __init__(self, collection, tenant_id: str):
+        self.collection = collection
+        self.tenant_id = tenant_id
+        self._prefix = f"{tenant_id}/"
+
+    def _stored_ids(self, ids: Optional[List[str]]) -> Optional[List[str]]:
+        return None if ids is None else [self._prefix + i for i in ids]
+
+    def _tenant_ids(self, ids: List[str]) -> List[str]:
+        return [i[len(self._prefix):] for i in ids]
+
+    def count(self) -> int:
+        """Exact, but lists every id of the tenant; VectorDB uses its registry's chunk total instead."""
+        return len(self.collection.get(where=tenant_where(self.tenant_id), include=[])["ids"])
+
+    def upsert(self, ids: List[str], embeddings, metadatas: List[Dict[str, Any]], documents: List[str]):
+        self.collection.upsert(
+            ids=self._stored_ids(ids),
+            embeddings=embeddings,
+            metadatas=[{**(m or {}), TENANT_KEY: self.tenant_id} for m in metadatas],
+            documents=documents
+        )
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        self.collection.delete(ids=self._stored_ids(ids), where=tenant_where(self.tenant_id, where))
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        result = dict(self.collection.get(
+            ids=self._stored_ids(ids), where=tenant_where(self.tenant_id, where),
+            limit=limit, offset=offset, include=list(include)
+        ))
+        result["ids"] = self._tenant_ids(result["ids"])
+        return result
+
+    def query(self, query_embeddings, n_results: int = 4, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> Dict[str, Any]:
+        result = dict(self.collection.query(
+            query_embeddings=query_embeddings, n_results=n_results,
+            where=tenant_where(self.tenant_id, where), include=list(include)
+        ))
+        result["ids"] = [self._tenant_ids(ids) for ids in result["ids"]]
+        return result
+
+
+class SharedCollectionStore:
+    """
+    Chunks of all tenants in one Chroma database, spread over `shards` collections.
+
+    One client (one SQLite file and one set of HNSW segments per shard) serves
+    every tenant, instead of a persist directory, client and index per user.
+    A tenant always lands on the same shard (tenant_shard), which keeps each
+    HNSW index and each tenant-filtered search bounded by the shard size.
+    Shard collections are created on first use.
+    """
+
+    def __init__(self, persist_directory: str, shards: int = 16, collection_name: str = "rag_collection"):
+        self.persist_directory = persist_directory
+        self.shards = max(1, shards)
+        self.collection_name = collection_name
+        self.client = chromadb.PersistentClient(path=persist_directory)
+        self._collections: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+        self.tenants_deleted = 0
+
+    def shard_collection(self, shard: int):
+        with self._lock:
+            collection = self._collections.get(shard)
+            if collection is None:
+                collection = self.client.get_or_create_collection(f"{self.collection_name}_{shard:03d}", embedding_function=None)
+                self._collections[shard] = collection
+            return collection
+
+    def for_tenant(self, tenant_id: str) -> TenantCollection:
+        return TenantCollection(self.shard_collection(tenant_shard(tenant_id, self.shards)), tenant_id)
+
+    def delete_tenant(self, tenant_id: str):
+        """Remove every chunk of a tenant with one filtered delete on its shard."""
+        self.for_tenant(tenant_id).delete()
+        with self._lock:
+            self.tenants_deleted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            collections = dict(self._collections)
+            deleted = self.tenants_deleted
+        return {
+            "shards": self.shards,
+            "open_shards": len(collections),
+            "chunks": sum(c.count() for c in collections.values()),
+            "tenants_deleted": deleted
+        }
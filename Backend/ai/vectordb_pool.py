@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+
+class _PooledHandle:
+    def __init__(self, key: str, semantic: bool, vdb):
+        self.key = key
+        self.semantic = semantic
+        self.vdb = vdb
+        self.leases = 0
+        self.retired = False
+        self.last_used = time.time()
+
+
+class VectorDBPool:
+    """
+    Per-process pool of open VectorDB handles, one per user.
+
+    Handles are leased with ``with pool.lease(email, semantic) as vdb:`` and
+    stay open between requests. Idle handles are closed after idle_timeout
+    seconds, and the least recently used idle handles are closed once more
+    than max_size are open. ``invalidate`` retires a user's handle before
+    their directory is deleted or rebuilt; a handle that is still leased is
+    closed as soon as its last lease ends.
+    """
+
+    def __init__(self, factory: Callable[[str, bool], Any], max_size: int = 64, idle_timeout: float = 600):
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._handles: "OrderedDict[str, _PooledHandle]" = OrderedDict()
+        # key -> [lock, number of requests using it]; an entry only lives while a key is being opened
+        self._open_locks: Dict[str, list] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @contextmanager
+    def lease(self, key: str, semantic: bool = False):
+        handle = self._acquire(key, semantic)
+        try:
+            yield handle.vdb
+        finally:
+            self._release(handle)
+
+    def _lease_open(self, key: str, semantic: bool) -> Optional[_PooledHandle]:
+        """Lease the open handle for key if it matches semantic; a mismatching one is retired."""
+        to_close: List[_PooledHandle] = []
+        with self._lock:
+            to_close.extend(self._collect_idle())
+            handle = self._handles.get(key)
+            if handle and handle.semantic == semantic:
+                handle.leases += 1
+                self._handles.move_to_end(key)
+            else:
+                if handle:
+                    del self._handles[key]
+                    to_close.extend(self._retire(handle))
+                handle = None
+        self._close_all(to_close)
+        return handle
+
+    def _acquire(self, key: str, semantic: bool) -> _PooledHandle:
+        handle = self._lease_open(key, semantic)
+        if handle:
+            with self._lock:
+                self.hits += 1
+            return handle
+
+        # Only one request per key opens the database; concurrent cold requests wait and share it
+        with self._lock:
+            entry = self._open_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                handle = self._lease_open(key, semantic)
+                if handle:
+                    with self._lock:
+                        self.hits += 1
+                    return handle
+                new_handle = _PooledHandle(key, semantic, self.factory(key, semantic))
+                with self._lock:
+                    self.misses += 1
+                    new_handle.leases = 1
+                    self._handles[key] = new_handle
+                    to_close = self._collect_overflow()
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._open_locks[key]
+        self._close_all(to_close)
+        return new_handle
+
+    def _release(self, handle: _PooledHandle):
+        with self._lock:
+            handle.leases -= 1
+            handle.last_used = time.time()
+            close_now = handle.retired and handle.leases == 0
+        if close_now:
+            self._close_all([handle])
+
+    def _retire(self, handle: _PooledHandle) -> List[_PooledHandle]:
+        handle.retired = True
+        return [handle] if handle.leases == 0 else []
+
+    def _collect_idle(self) -> List[_PooledHandle]:
+        now = time.time()
+        idle = [h for h in self._handles.values() if h.leases == 0 and now - h.last_used > self.idle_timeout]
+        for h in idle:
+            del self._handles[h.key]
+            self.evictions += 1
+        return [c for h in idle for c in self._retire(h)]
+
+    def _collect_overflow(self) -> List[_PooledHandle]:
+        closing: List[_PooledHandle] = []
+        for key in list(self._handles):
+            if len(self._handles) <= self.max_size:
+                break
+            h = self._handles[key]
+            if h.leases == 0:
+                del self._handles[key]
+                self.evictions += 1
+                closing.extend(self._retire(h))
+        return closing
+
+    def _close_all(self, handles: List[_PooledHandle]):
+        for h in handles:
+            try:
+                h.vdb.close()
+            except Exception as e:
+                print(f"Warning: Error closing pooled database for {h.key}: {e}")
+
+    def invalidate(self, key: str) -> bool:
+        """Drop a user's handle, e.g. before their vector DB directory is removed."""
+        with self._lock:
+            handle = self._handles.pop(key, None)
+            if handle is None:
+                return False
+            self.invalidations += 1
+            to_close = self._retire(handle)
+        self._close_all(to_close)
+        return True
+
+    def evict_idle(self):
+        with self._lock:
+            to_close = self._collect_idle()
+        self._close_all(to_close)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "open_handles": len(self._handles),
+                "leased_handles": sum(1 for h in self._handles.values() if h.leases),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "opening": len(self._open_locks)
+            }
@@ -1,27 +1,132 @@
 import os
 import re
+import copy
 import glob
+import itertools
 import json
 import hashlib
+import queue
+import threading
 import time
+import uuid
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import CSVLoader, PyPDFLoader
 from langchain_core.documents import Document
-from langchain_community.retrievers import BM25Retriever
-from langchain_classic.retrievers import EnsembleRetriever
+from langchain_core.retrievers import BaseRetriever
 from langchain_chroma import Chroma
+from pydantic import Field
 from ai.constant import *
+from ai.embedding_cache import EmbeddingCache, embedding_model_name
+from ai.sparse_index import BM25Index
+from ai.flat_index import FlatIndex, normalize_rows
+from ai.pdf_pages import iter_pages_parallel
+from ai.tenant_store import SharedCollectionStore, TenantCollection
+
+class IngestionCancelled(Exception):
+    pass
+
+# Shared by query-time searches that run the dense and sparse sides concurrently
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+
+def fuse_rankings(rankings: List[Tuple[List[str], Optional[np.ndarray], float]], method: str = "rrf", rrf_k: int = RRF_K) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked result lists into one ranking, best first.
+    
+    Each ranking is (ids best first, raw scores or None, weight). "rrf" scores
+    an id by the sum of weight / (rrf_k + rank); "weighted" min-max normalizes
+    each list's raw scores to [0, 1] and sums weight * normalized score. A
+    list without raw scores gets 1 - (rank - 1) / len in weighted mode, on
+    the same [0, 1] scale, so it competes with the scored lists instead of
+    contributing RRF-sized crumbs. All lists are concatenated and
+    accumulated with NumPy in one pass.
+    """
+    rankings = [r for r in rankings if len(r[0])]
+    if not rankings:
+        return []
+    ids = np.array([i for ranked, _, _ in rankings for i in ranked], dtype=object)
+    contributions = []
+    for ranked, raw, weight in rankings:
+        if method == "weighted" and raw is not None:
+            raw = np.asarray(raw, dtype=np.float64)
+            spread = raw.max() - raw.min()
+            contributions.append(weight * ((raw - raw.min()) / spread if spread > 0 else np.ones(len(raw))))
+        elif method == "weighted":
+            contributions.append(weight * (1 - np.arange(len(ranked), dtype=np.float64) / len(ranked)))
+        else:
+            contributions.append(weight / (rrf_k + np.arange(1, len(ranked) + 1, dtype=np.float64)))
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(unique_ids))
+    order = np.argsort(-scores, kind="stable")
+    return [(unique_ids[i], float(scores[i])) for i in order]
+
+def mmr_select(relevance: np.ndarray, similarity: np.ndarray, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Greedy maximal marginal relevance over a candidate set.
+
+    relevance[i] is candidate i's similarity to the query and similarity the
+    candidates' pairwise similarity matrix. Each step scores every candidate
+    at once as lambda * relevance - (1 - lambda) * (max similarity to the
+    already selected ones) and takes the best. Returns candidate positions in
+    selection order.
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[:, selected[0]].astype(np.float64, copy=True)
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, n):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[:, best], out=redundancy)
+    return selected
+
+def chroma_where(meta_filter: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Chroma where clause for an equality filter; several keys must be combined with $and."""
+    if not meta_filter:
+        return None
+    if len(meta_filter) == 1:
+        return dict(meta_filter)
+    return {"$and": [{key: value} for key, value in meta_filter.items()]}
+
+def update_registry_stats(stats: Dict[str, Any], entry: Dict[str, Any], sign: int = 1) -> None:
+    """Add (sign=1) or subtract (sign=-1) one registry entry's chunks from the running aggregates."""
+    count = sign * entry.get("chunk_count", 0)
+    stats["total_chunks"] += count
+    for group, key in (("files", "filename"), ("categories", "category"), ("chunking_methods", "chunking_method")):
+        name = entry.get(key) or "unknown"
+        value = stats[group].get(name, 0) + count
+        if value > 0:
+            stats[group][name] = value
+        else:
+            stats[group].pop(name, None)
+
+def registry_stats(docs: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Chunk counts in total and per file, category and chunking method, from the registry entries."""
+    stats = {"total_chunks": 0, "files": {}, "categories": {}, "chunking_methods": {}}
+    for entry in docs.values():
+        update_registry_stats(stats, entry)
+    return stats
 
 def load_registry(registry_path: str = None) -> Dict[str, Any]:
     path = registry_path or REGISTRY_PATH
     if not os.path.exists(path):
-        return {"docs": {}}
+        return {"docs": {}, "stats": registry_stats({})}
     with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        reg = json.load(f)
+    # Registries written before the aggregates existed
+    if "stats" not in reg:
+        reg["stats"] = registry_stats(reg.get("docs", {}))
+    return reg
     
 def save_registry(reg: Dict[str, Any], registry_path: str = None) -> None:
     path = registry_path or REGISTRY_PATH
@@ -55,9 +160,63 @@ def infer_category(filename: str) -> str:
         return "anime"
     return "general"
 
+def release_chroma_system(persist_directory: str, system=None):
+    """
+    Stop Chroma's shared in-process system for a directory.
+
+    Chroma caches one system per persist path for the life of the process. Once
+    that directory has been deleted the cached system can only fail with
+    "readonly database", so it must be dropped before the path is reused. If
+    system is given, it is only released if it is still the cached one.
+    """
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+        cached = SharedSystemClient._identifier_to_system.get(persist_directory)
+        if cached is None or (system is not None and cached is not system):
+            return
+        del SharedSystemClient._identifier_to_system[persist_directory]
+        cached.stop()
+    except Exception as e:
+        print(f"Warning: Could not release Chroma system for {persist_directory}: {e}")
+
 def make_doc_id(filename: str, content_hash: str) -> str:
     return f"{normalize(filename)}__{content_hash[:12]}"
 
+def check_dense_backend(dense_backend: str, shared: bool = False) -> None:
+    """Raise ValueError unless VectorDB can open dense_backend (only Chroma backs the shared multi-tenant store)."""
+    if dense_backend not in ("chroma", "flat"):
+        raise ValueError(f"Unknown dense backend: {dense_backend} (expected 'chroma' or 'flat')")
+    if shared and dense_backend != "chroma":
+        raise ValueError(f"The shared multi-tenant store needs the 'chroma' dense backend, not '{dense_backend}'")
+
+def index_config(semantic: bool, embedding, dense_backend: str = DENSE_BACKEND) -> Dict[str, Any]:
+    """Parameters that change what gets stored in the index; any change requires a rebuild."""
+    if semantic:
+        chunking = {
+            "chunking_method": "semantic",
+            "similarity_threshold": SEMANTIC_SIMILARITY_THRESHOLD,
+            "min_chunk_size": SEMANTIC_MIN_CHUNK_SIZE,
+            "max_chunk_size": SEMANTIC_MAX_CHUNK_SIZE,
+        }
+    else:
+        chunking = {
+            "chunking_method": "standard",
+            "chunk_size": STANDARD_CHUNK_SIZE,
+            "chunk_overlap": STANDARD_CHUNK_OVERLAP,
+        }
+    config = {**chunking, "embedding_model": embedding_model_name(embedding)}
+    # Chroma indexes were registered before the backend was configurable
+    if dense_backend != "chroma":
+        config["dense_backend"] = dense_backend
+    return config
+
+def is_index_current(registry_path: str, path: str, config: Dict[str, Any]) -> bool:
+    """True if the registry holds this exact file, indexed with the given config."""
+    if not os.path.exists(registry_path) or not os.path.exists(path):
+        return False
+    entry = load_registry(registry_path)["docs"].get(os.path.abspath(path))
+    return bool(entry) and entry.get("content_hash") == sha256_file(path) and entry.get("index_config") == config
+
 class CustomSemanticChunker:
     def __init__(self, embeddings, similarity_threshold=0.75, min_chunk_size=100, max_chunk_size=1500):
         self.embeddings = embeddings
@@ -122,9 +281,11 @@ class CustomSemanticChunker:
         
         return chunks
     
-    def split(self, documents: List[Document]) -> List[Document]:
+    def split(self, documents: List[Document], per_doc_counter: Optional[Dict[str, int]] = None) -> List[Document]:
+        """Split documents; pass per_doc_counter to keep chunk indices running across calls."""
+        streaming = per_doc_counter is not None
+        per_doc_counter = per_doc_counter if streaming else {}
         all_chunks = []
-        per_doc_counter: Dict[str, int] = {}
         
         for doc in documents:
             doc_id = doc.metadata.get("doc_id", "unknown_doc")
@@ -147,12 +308,142 @@ class CustomSemanticChunker:
                 )
                 all_chunks.append(chunk_doc)
         
-        print(f"Created {len(all_chunks)} semantic chunks from {len(documents)} documents")
+        if not streaming:
+            print(f"Created {len(all_chunks)} semantic chunks from {len(documents)} documents")
         return all_chunks
 
+class BatchedSemanticChunker(CustomSemanticChunker):
+    """
+    Semantic chunker that embeds every sentence exactly once.
+
+    Sentences are embedded in large ``embed_documents`` batches and each break
+    decision compares the next sentence against the running centroid of the
+    current chunk, so the number of model calls grows linearly with the text.
+    """
+
+    def __init__(self, embeddings, similarity_threshold=0.75, min_chunk_size=100, max_chunk_size=1500, embed_batch_size: int = SEMANTIC_EMBED_BATCH_SIZE):
+        super().__init__(embeddings, similarity_threshold, min_chunk_size, max_chunk_size)
+        self.embed_batch_size = max(1, embed_batch_size)
+
+    def embed_sentences(self, sentences: List[str]) -> np.ndarray:
+        """Embed sentences in batches and return an L2-normalized matrix."""
+        vectors = []
+        for i in range(0, len(sentences), self.embed_batch_size):
+            vectors.extend(self.embeddings.embed_documents(sentences[i:i + self.embed_batch_size]))
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def create_semantic_chunks_from_text(self, text):
+        sentences = self.split_into_sentences(text)
+        if not sentences:
+            return []
+
+        n = len(sentences)
+        print(f"Processing {n} sentences for semantic chunking (batched)...")
+
+        try:
+            vectors = self.embed_sentences(sentences)
+        except Exception as e:
+            # Same fallback as compute_similarity: every similarity becomes 0.0
+            print(f"Error embedding sentences: {e}")
+            vectors = np.zeros((n, 1), dtype=np.float32)
+
+        # cum[j] - 1 is the length of " ".join(sentences[:j + 1])
+        cum = np.cumsum(np.fromiter((len(s) + 1 for s in sentences), dtype=np.int64, count=n))
+        limit = max(self.max_chunk_size, self.min_chunk_size)
+
+        chunks = []
+        start = 0
+        while start < n - 1:
+            offset = int(cum[start - 1]) if start > 0 else 0
+            # A chunk can never outgrow the size limit, so only a bounded window
+            # of sentences can hold the next break.
+            stop = min(n, int(np.searchsorted(cum, offset + limit + 1, side="right")) + 2)
+
+            window = vectors[start:stop]
+            centroids = np.cumsum(window[:-1], axis=0)
+            norms = np.linalg.norm(centroids, axis=1)
+            dots = np.einsum("ij,ij->i", centroids, window[1:])
+            similarities = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+            current_lens = cum[start:stop - 1] - offset - 1
+            potential_lens = cum[start + 1:stop] - offset - 1
+            breaks = (
+                (similarities < self.similarity_threshold) |
+                (potential_lens > self.max_chunk_size)
+            ) & (current_lens >= self.min_chunk_size)
+
+            if not breaks.any():
+                break
+
+            end = start + 1 + int(np.argmax(breaks))
+            chunks.append(" ".join(sentences[start:end]))
+            start = end
+
+        final_chunk_text = " ".join(sentences[start:])
+        if len(final_chunk_text) >= self.min_chunk_size:
+            chunks.append(final_chunk_text)
+        elif chunks:
+            chunks[-1] += " " + final_chunk_text
+
+        return chunks
+
+def _prefetch(iterable, maxsize: int = PIPELINE_QUEUE_SIZE) -> Iterator:
+    """
+    Run an iterator on a background thread and hand its items over through a bounded queue.
+
+    The producer blocks once maxsize items are waiting, which bounds memory while
+    still letting it run ahead of the consumer. Producer exceptions are re-raised
+    in the consumer, and closing the returned generator stops the producer.
+    """
+    items = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+    done = object()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((None, item)):
+                    return
+            put((None, done))
+        except BaseException as e:
+            put((e, None))
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            error, item = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
 class FolderLoader:
-    def __init__(self, file_types: Tuple[str, ...] = ("csv", "pdf")):
+    def __init__(self, file_types: Tuple[str, ...] = ("csv", "pdf"), parallel: bool = False, max_workers: Optional[int] = None, pages_per_task: int = PDF_PAGES_PER_TASK):
         self.file_types = file_types
+        self.parallel = parallel
+        # Up to INGEST_WORKERS jobs extract at once, so each gets its share of the cores
+        self.max_workers = max_workers or PDF_EXTRACT_WORKERS or max(1, (os.cpu_count() or 1) // max(1, INGEST_WORKERS))
+        self.pages_per_task = max(1, pages_per_task)
 
     def list_paths(self, folder_path: str) -> List[str]:
         paths: List[str] = []
@@ -160,12 +451,51 @@ class FolderLoader:
             paths.extend(glob.glob(os.path.join(folder_path, f"*.{ext}")))
         return sorted(paths)
 
+    def iter_pdf_pages(self, path: str) -> Iterator[Document]:
+        """
+        Yield PDF pages in order.
+
+        In parallel mode the page range is split into tasks of pages_per_task
+        pages that run on worker processes (ai.pdf_pages); each task's pages
+        are yielded as soon as it and every task before it have finished.
+        """
+        loader = PyPDFLoader(path)
+        if not self.parallel or self.max_workers < 2:
+            yield from loader.lazy_load()
+            return
+
+        import pypdf
+        total_pages = len(pypdf.PdfReader(path).pages)
+        if total_pages < 2 * self.pages_per_task:
+            yield from loader.lazy_load()
+            return
+
+        ranges = [(i, min(i + self.pages_per_task, total_pages)) for i in range(0, total_pages, self.pages_per_task)]
+        workers = min(self.max_workers, len(ranges))
+        print(f"Extracting {total_pages} pages with {workers} worker processes")
+        for text, metadata in iter_pages_parallel(path, loader.file_path, ranges, workers):
+            yield Document(page_content=text, metadata=metadata)
+
+    def iter_file(self, path: str, base_meta: Dict[str, Any]) -> Iterator[Document]:
+        """Lazily yield the pages (PDF) or rows (CSV) of a file with base_meta applied."""
+        filename = os.path.basename(path)
+        if filename.lower().endswith(".pdf"):
+            docs = self.iter_pdf_pages(path)
+        elif filename.lower().endswith(".csv"):
+            docs = CSVLoader(path).lazy_load()
+        else:
+            return
+
+        for d in docs:
+            d.metadata.update(base_meta)
+            yield d
+
     def load_file(self, path: str, base_meta: Dict[str, Any]) -> List[Document]:
         filename = os.path.basename(path)
         print(f"Loading file: {filename}")
         
         if filename.lower().endswith(".pdf"):
-            pages = PyPDFLoader(path).load()
+            pages = list(self.iter_pdf_pages(path))
             for p in pages:
                 p.metadata.update(base_meta)
             print(f"Loaded {len(pages)} pages from PDF")
@@ -184,9 +514,11 @@ class Splitter:
     def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50):
         self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
-    def split(self, documents: List[Document]) -> List[Document]:
+    def split(self, documents: List[Document], per_doc_counter: Optional[Dict[str, int]] = None) -> List[Document]:
+        """Split documents; pass per_doc_counter to keep chunk indices running across calls."""
+        streaming = per_doc_counter is not None
+        per_doc_counter = per_doc_counter if streaming else {}
         chunks = self.splitter.split_documents(documents)
-        per_doc_counter: Dict[str, int] = {}
         
         for ch in chunks:
             doc_id = ch.metadata.get("doc_id", "unknown_doc")
@@ -197,35 +529,134 @@ class Splitter:
             ch.metadata["chunk_index"] = idx
             ch.metadata["chunking_method"] = "standard"
         
-        print(f"Created {len(chunks)} standard chunks from {len(documents)} documents")
+        if not streaming:
+            print(f"Created {len(chunks)} standard chunks from {len(documents)} documents")
         return chunks
 
+class SparseIndexRetriever(BaseRetriever):
+    """LangChain retriever over a VectorDB's persistent BM25 index."""
+    vectordb: Any
+    k: int = 4
+    meta_filter: Optional[Dict[str, Any]] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.vectordb.sparse_search(query, k=self.k, meta_filter=self.meta_filter)
+
+class HybridSearchRetriever(BaseRetriever):
+    """LangChain retriever over VectorDB.hybrid_search."""
+    vectordb: Any
+    k: int = 4
+    fetch_k: Optional[int] = None
+    dense_weight: float = 0.7
+    sparse_weight: float = 0.3
+    fusion: str = "rrf"
+    meta_filter: Optional[Dict[str, Any]] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.vectordb.hybrid_search(
+            query, k=self.k, fetch_k=self.fetch_k, dense_weight=self.dense_weight,
+            sparse_weight=self.sparse_weight, fusion=self.fusion, meta_filter=self.meta_filter
+        )
+
+class DenseSearchRetriever(BaseRetriever):
+    """LangChain retriever over VectorDB.similarity_search / VectorDB.mmr_search; MMR stage times land in timings."""
+    vectordb: Any
+    k: int = 4
+    search_type: str = "mmr"
+    fetch_k: int = MMR_FETCH_K
+    lambda_mult: float = MMR_LAMBDA
+    meta_filter: Optional[Dict[str, Any]] = None
+    timings: Dict[str, float] = Field(default_factory=dict)
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        if self.search_type == "mmr":
+            return self.vectordb.mmr_search(
+                query, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult,
+                meta_filter=self.meta_filter, timings=self.timings
+            )
+        return self.vectordb.similarity_search(query, k=self.k, meta_filter=self.meta_filter)
+
 class VectorDB:
-    def __init__(self, embedding, persist_directory: str = DB_DIR, batch_size: int = 1000, semantic: bool = False, registry_path: str = None):
+    def __init__(self, embedding, persist_directory: str = DB_DIR, batch_size: int = 1000, semantic: bool = False, registry_path: str = None, embedding_cache: Optional[EmbeddingCache] = None, dense_backend: str = DENSE_BACKEND,
+                 tenant_store: Optional[SharedCollectionStore] = None, tenant_id: Optional[str] = None):
         self.semantic = semantic
+        self.embedding = embedding
+        self.embedding_cache = embedding_cache
         self.registry_path = registry_path or REGISTRY_PATH
-        self.db = Chroma(
-            persist_directory=persist_directory,
-            collection_name=COLLECTION,
-            embedding_function=embedding
-        )
+        self.persist_directory = persist_directory
+        self.dense_backend = dense_backend
+        self.tenant_id = tenant_id
+        check_dense_backend(dense_backend, shared=tenant_store is not None)
+        if tenant_store is not None:
+            # Chunks live in a collection shared by all tenants; registry and BM25 stay in persist_directory
+            if not tenant_id:
+                raise ValueError("tenant_id is required with a shared tenant store")
+            self.db = None
+            self._chroma_system = None
+            self.collection = tenant_store.for_tenant(tenant_id)
+        elif dense_backend == "flat":
+            # Exact search over a memory-mapped matrix; see FlatIndex
+            self.db = None
+            self._chroma_system = None
+            self.collection = FlatIndex(os.path.join(persist_directory, FLAT_INDEX_DIR), dtype=FLAT_INDEX_DTYPE)
+        else:
+            self.db = Chroma(
+                persist_directory=persist_directory,
+                collection_name=COLLECTION,
+                embedding_function=embedding
+            )
+            self._chroma_system = self.db._client._system
+            self.collection = self.db._collection
         self.reg = load_registry(self.registry_path)
+        self.sparse_index = BM25Index(os.path.join(persist_directory, SPARSE_INDEX_DIR))
         
         if self.semantic:
-            self.splitter = CustomSemanticChunker(
+            self.splitter = BatchedSemanticChunker(
                 embeddings=embedding,
-                similarity_threshold=0.75,
-                min_chunk_size=100,
-                max_chunk_size=1500
+                similarity_threshold=SEMANTIC_SIMILARITY_THRESHOLD,
+                min_chunk_size=SEMANTIC_MIN_CHUNK_SIZE,
+                max_chunk_size=SEMANTIC_MAX_CHUNK_SIZE
             )
         else:
-            self.splitter = Splitter(chunk_size=500, chunk_overlap=50)
+            self.splitter = Splitter(chunk_size=STANDARD_CHUNK_SIZE, chunk_overlap=STANDARD_CHUNK_OVERLAP)
+        self.index_config = index_config(semantic, embedding, dense_backend)
             
-        self.loader = FolderLoader(file_types=("csv", "pdf"))
+        self.loader = FolderLoader(file_types=("csv", "pdf"), parallel=PARALLEL_PDF_EXTRACTION)
         self.batch_size = max(1, min(batch_size, 5000))
+        if dense_backend == "flat" and self.collection.load_failed:
+            self._reindex_unloadable_flat_index()
+
+    def _reindex_unloadable_flat_index(self):
+        """
+        Re-ingest every registered file after the saved flat index failed to load.
+        The registry would otherwise keep reporting the files as indexed while
+        the dense index is empty, so nothing else would rebuild it.
+        """
+        paths = list(self.reg["docs"])
+        print(f"Warning: Flat index in {self.persist_directory} is unusable, re-indexing {len(paths)} files")
+        self.reg = {"docs": {}, "stats": registry_stats({})}
+        self.sparse_index.remove({})
+        self.persist()
+        for path in paths:
+            if not os.path.exists(path):
+                print(f"Warning: {path} no longer exists, dropped from the index")
+                continue
+            try:
+                self.ingest_file_incremental(path)
+            except Exception as e:
+                print(f"Warning: Could not re-index {path}: {e}")
 
     def _safe_persist(self):
-        """Safely persist the database, handling both old and new Chroma versions."""
+        """
+        Safely persist the database, handling both old and new Chroma versions.
+
+        The flat index only reaches disk through save(), so its errors
+        propagate (and ingest rolls back) instead of being downgraded to a
+        warning.
+        """
+        if self.dense_backend == "flat":
+            self.collection.save()
+            return
         try:
             if hasattr(self.db, 'persist'):
                 self.db.persist()
@@ -238,25 +669,25 @@ class VectorDB:
     def close(self):
         """Properly close the database connection"""
         try:
-            # For newer ChromaDB versions, just clear references
-            if hasattr(self.db, '_client') and self.db._client:
-                try:
-                    if hasattr(self.db._client, 'reset'):
-                        self.db._client.reset()
-                except:
-                    pass
+            # Release Chroma's cached system for this directory (unless it has
+            # already been replaced) so the next client starts from the files on disk
+            if self.db is not None:
+                release_chroma_system(self.persist_directory, self._chroma_system)
             # Clear main reference
             self.db = None
+            self.collection = None
             print("Database connection closed")
         except Exception as e:
             print(f"Error closing database: {e}")
 
     def persist(self):
         self._safe_persist()
+        self.sparse_index.save()
         save_registry(self.reg, self.registry_path)
 
     def _register(self, abs_path: str, filename: str, category: str, content_hash: str, doc_id: str, chunk_count: int, added_at: str):
-        self.reg["docs"][abs_path] = {
+        self._unregister(abs_path)
+        entry = self.reg["docs"][abs_path] = {
             "doc_id": doc_id,
             "filename": filename,
             "abs_path": abs_path,
@@ -264,57 +695,97 @@ class VectorDB:
             "content_hash": content_hash,
             "added_at": added_at,
             "chunk_count": chunk_count,
-            "chunking_method": "semantic" if self.semantic else "standard"
+            "chunking_method": "semantic" if self.semantic else "standard",
+            "index_config": self.index_config
         }
+        update_registry_stats(self.reg["stats"], entry)
 
-    def _add_documents_batched(self, docs: List[Document]):
-        if not docs:
-            print("No documents to add")
-            return
-            
-        print(f"Adding {len(docs)} documents to vector store in batches of {self.batch_size}")
-        
-        max_retries = 3
-        for i in range(0, len(docs), self.batch_size):
-            batch = docs[i:i + self.batch_size]
-            batch_num = i//self.batch_size + 1
-            total_batches = (len(docs)-1)//self.batch_size + 1
-            
-            # Retry mechanism for each batch
-            for retry in range(max_retries):
-                try:
-                    self.db.add_documents(batch)
-                    print(f"✓ Added batch {batch_num}/{total_batches} ({len(batch)} docs)")
-                    break  # Success, move to next batch
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    if retry < max_retries - 1:
-                        wait_time = 2 * (retry + 1)  # 2, 4 seconds
-                        print(f"✗ Batch {batch_num} failed (attempt {retry+1}/{max_retries}): {error_msg}")
-                        print(f"  Retrying in {wait_time}s...")
-                        time.sleep(wait_time)
-                    else:
-                        print(f"✗ Batch {batch_num} failed after {max_retries} attempts")
-                        raise Exception(f"Failed to add batch {batch_num} after {max_retries} retries: {error_msg}")
-        
-        print("All batches added successfully, persisting...")
-        self._safe_persist()
-        print("✓ Vector store persisted successfully")
+    def _unregister(self, abs_path: str):
+        entry = self.reg["docs"].pop(abs_path, None)
+        if entry is not None:
+            update_registry_stats(self.reg["stats"], entry, -1)
+
+    def _embed_batch(self, docs: List[Document]) -> List[List[float]]:
+        texts = [d.page_content for d in docs]
+        if self.embedding_cache is not None:
+            return self.embedding_cache.embed_documents(self.embedding, texts)
+        return self.embedding.embed_documents(texts)
 
-    def ingest_file_incremental(self, path: str):
+    def _write_batch(self, docs: List[Document], embeddings: List[List[float]], batch_label: str, max_retries: int = 3):
+        """
+        Upsert pre-embedded documents, retrying with backoff, and add them to the
+        in-memory BM25 index. Ids are chunk ids, so retries are idempotent.
+        """
+        ids = [d.metadata.get("chunk_id") or str(uuid.uuid4()) for d in docs]
+        for retry in range(max_retries):
+            try:
+                self.collection.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    metadatas=[d.metadata for d in docs],
+                    documents=[d.page_content for d in docs]
+                )
+                self.sparse_index.add(ids, [d.page_content for d in docs], [d.metadata for d in docs])
+                print(f"✓ Added batch {batch_label} ({len(docs)} docs)")
+                return
+
+            except Exception as e:
+                error_msg = str(e)
+                if retry < max_retries - 1:
+                    wait_time = 2 * (retry + 1)  # 2, 4 seconds
+                    print(f"✗ Batch {batch_label} failed (attempt {retry+1}/{max_retries}): {error_msg}")
+                    print(f"  Retrying in {wait_time}s...")
+                    time.sleep(wait_time)
+                else:
+                    print(f"✗ Batch {batch_label} failed after {max_retries} attempts")
+                    raise Exception(f"Failed to add batch {batch_label} after {max_retries} retries: {error_msg}")
+
+    def _iter_chunk_batches(self, pages: Iterator[Document]) -> Iterator[List[Document]]:
+        """Split pages as they arrive and regroup the chunks into batch_size batches."""
+        per_doc_counter: Dict[str, int] = {}
+        batch: List[Document] = []
+        for page in pages:
+            batch.extend(self.splitter.split([page], per_doc_counter))
+            while len(batch) >= self.batch_size:
+                yield batch[:self.batch_size]
+                batch = batch[self.batch_size:]
+        if batch:
+            yield batch
+
+    def _iter_embedded_batches(self, batches: Iterator[List[Document]]) -> Iterator[Tuple[List[Document], List[List[float]]]]:
+        for batch in batches:
+            yield batch, self._embed_batch(batch)
+
+    def ingest_file_incremental(self, path: str, on_progress: Optional[Callable[[int, int], None]] = None, should_cancel: Optional[Callable[[], bool]] = None):
+        """
+        Ingest a file through a streaming pipeline.
+
+        Loading + splitting, embedding and writing to Chroma each run on their own
+        thread, connected by bounded queues, so at most a few batches are held in
+        memory and the embedding model works while later pages are still parsed.
+        The registry entry is only written once the last batch has landed; on
+        failure the partially written chunks are removed again.
+
+        Args:
+            path: File to ingest
+            on_progress: Optional callback receiving (pages_loaded, chunks_written) after each batch
+            should_cancel: Optional callable polled between batches; returning True
+                aborts ingestion with IngestionCancelled
+        """
         abs_path = os.path.abspath(path)
         filename = os.path.basename(path)
         content_hash = sha256_file(path)
         existing = self.reg["docs"].get(abs_path)
 
-        if existing and existing.get("content_hash") == content_hash:
+        if existing and existing.get("content_hash") == content_hash and existing.get("index_config") == self.index_config:
             print(f"File {filename} unchanged, skipping...")
             return
 
-        if existing and existing.get("doc_id") and existing.get("content_hash") != content_hash:
+        if existing and existing.get("doc_id"):
             print(f"Removing old version of {filename}")
-            self.db.delete(where={"doc_id": existing["doc_id"]})
+            self.collection.delete(where={"doc_id": existing["doc_id"]})
+            self.sparse_index.remove({"doc_id": existing["doc_id"]})
+            self._unregister(abs_path)
             self._safe_persist()
 
         doc_id = make_doc_id(filename, content_hash)
@@ -332,24 +803,56 @@ class VectorDB:
         }
 
         print(f"Processing {filename} with {'semantic' if self.semantic else 'standard'} chunking...")
-        
-        docs = self.loader.load_file(path, base_meta)
-        
-        if not docs:
+        print(f"Streaming {filename} to vector store in batches of {self.batch_size}")
+
+        page_count = 0
+        chunk_count = 0
+        batch_num = 0
+
+        def pages():
+            nonlocal page_count
+            for page in self.loader.iter_file(path, base_meta):
+                page_count += 1
+                yield page
+
+        embedded = _prefetch(self._iter_embedded_batches(_prefetch(self._iter_chunk_batches(pages()))))
+        try:
+            for batch, embeddings in embedded:
+                if should_cancel and should_cancel():
+                    raise IngestionCancelled(f"Ingestion of {filename} was cancelled")
+                batch_num += 1
+                self._write_batch(batch, embeddings, str(batch_num))
+                chunk_count += len(batch)
+                if on_progress:
+                    on_progress(page_count, chunk_count)
+            if chunk_count:
+                print(f"Loaded {page_count} pages, persisting...")
+                self._register(abs_path, filename, category, content_hash, doc_id, chunk_count, added_at)
+                self.persist()
+        except Exception:
+            if batch_num:
+                print(f"Ingestion of {filename} failed, removing partially written chunks")
+                try:
+                    self._unregister(abs_path)
+                    self.sparse_index.remove({"doc_id": doc_id})
+                    self.collection.delete(where={"doc_id": doc_id})
+                except Exception as e:
+                    print(f"Warning: Could not remove partial chunks: {e}")
+            raise
+        finally:
+            embedded.close()
+
+        if not page_count:
             print(f"No content loaded from {filename}")
             return
-            
-        chunks = self.splitter.split(docs)
-        
-        if not chunks:
+
+        if not chunk_count:
             print(f"No chunks created from {filename}")
             return
-            
-        self._add_documents_batched(chunks)
-        self._register(abs_path, filename, category, content_hash, doc_id, len(chunks), added_at)
-        self.persist()
         
-        print(f"Successfully processed {filename}: {len(chunks)} chunks created")
+        print(f"Successfully processed {filename}: {chunk_count} chunks created")
+        if self.embedding_cache is not None:
+            print(f"Embedding cache: {self.embedding_cache.stats()}")
 
     def ingest_folder_incremental(self, folder_path: str):
         print(f"Looking for files in: {folder_path}")
@@ -375,11 +878,11 @@ class VectorDB:
         self.ingest_file_incremental(path)
 
     def remove_by_doc_id(self, doc_id: str):
-        self.db.delete(where={"doc_id": doc_id})
-        self._safe_persist()
+        self.collection.delete(where={"doc_id": doc_id})
+        self.sparse_index.remove({"doc_id": doc_id})
         to_del = [k for k, v in self.reg["docs"].items() if v.get("doc_id") == doc_id]
         for k in to_del:
-            del self.reg["docs"][k]
+            self._unregister(k)
         self.persist()
 
     def remove_by_filename(self, filename: str):
@@ -390,77 +893,216 @@ class VectorDB:
     def list_docs(self) -> List[Dict[str, Any]]:
         return sorted(self.reg["docs"].values(), key=lambda x: x.get("added_at", ""))
 
-    def as_retriever(self, k: int = 4, meta_filter: Optional[Dict[str, Any]] = None):
-        return self.db.as_retriever(search_type="mmr",search_kwargs={"k": k, "filter": meta_filter} if meta_filter else {"k": k})
+    def as_retriever(self, k: int = 4, meta_filter: Optional[Dict[str, Any]] = None, fetch_k: Optional[int] = None, lambda_mult: float = MMR_LAMBDA):
+        return DenseSearchRetriever(
+            vectordb=self, k=k, search_type="mmr", fetch_k=fetch_k or MMR_FETCH_K,
+            lambda_mult=lambda_mult, meta_filter=meta_filter
+        )
+
+    def similarity_search(self, query: str, k: int = 4, meta_filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        result = self.collection.query(
+            query_embeddings=[self.embedding.embed_query(query)],
+            n_results=k,
+            where=chroma_where(meta_filter),
+            include=["documents", "metadatas"]
+        )
+        return [
+            Document(page_content=content, metadata=metadata or {})
+            for content, metadata in zip(result["documents"][0], result["metadatas"][0])
+        ]
+
+    def mmr_search(self, query: str, k: int = 4, fetch_k: int = MMR_FETCH_K, lambda_mult: float = MMR_LAMBDA,
+                   meta_filter: Optional[Dict[str, Any]] = None, timings: Optional[Dict[str, float]] = None) -> List[Document]:
+        """
+        Maximal marginal relevance search: k diverse results out of the fetch_k most similar.
+        
+        The candidates are fetched in one query together with their texts,
+        metadata and embeddings, and selected with mmr_select on their
+        similarity matrix. If timings is given it receives mmr_fetch_ms,
+        mmr_select_ms and mmr_candidates.
+        """
+        query_embedding = self.embedding.embed_query(query)
+        started = time.perf_counter()
+        result = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=max(k, fetch_k),
+            where=chroma_where(meta_filter),
+            include=["documents", "metadatas", "embeddings"]
+        )
+        fetched = time.perf_counter()
+        chosen = []
+        if len(result["ids"][0]):
+            candidates = normalize_rows(result["embeddings"][0])
+            chosen = mmr_select(candidates @ normalize_rows(query_embedding)[0], candidates @ candidates.T, k, lambda_mult)
+        if timings is not None:
+            timings.update({
+                "mmr_fetch_ms": round((fetched - started) * 1000, 2),
+                "mmr_select_ms": round((time.perf_counter() - fetched) * 1000, 2),
+                "mmr_candidates": len(result["ids"][0])
+            })
+        return [
+            Document(page_content=result["documents"][0][i], metadata=result["metadatas"][0][i] or {})
+            for i in chosen
+        ]
+
+    def _stored_chunk_count(self) -> int:
+        """
+        Number of chunks in the dense store. A tenant's view of the shared
+        collection can only count by listing all of its ids, so tenants use the
+        registry's running total instead.
+        """
+        if isinstance(self.collection, TenantCollection):
+            return self.reg["stats"]["total_chunks"]
+        return self.collection.count()
+
+    def _ensure_sparse_index(self):
+        """Build the BM25 index from the stored chunks for databases created before it existed."""
+        if len(self.sparse_index) or not self._stored_chunk_count():
+            return
+        print("BM25 index missing, building it from the vector store...")
+        docs_data = self.collection.get(include=["documents", "metadatas"])
+        self.sparse_index.add(docs_data["ids"], docs_data["documents"], docs_data["metadatas"])
+        self.sparse_index.save()
+
+    def _documents_by_id(self, ids: List[str]) -> Dict[str, Document]:
+        if not ids:
+            return {}
+        data = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            i: Document(page_content=content, metadata=metadata or {})
+            for i, content, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+        }
+
+    def _get_documents(self, ids: List[str]) -> List[Document]:
+        """Fetch documents by id from the vector store, preserving the order of ids."""
+        by_id = self._documents_by_id(ids)
+        return [by_id[i] for i in ids if i in by_id]
+
+    def sparse_search(self, query: str, k: int = 4, meta_filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        hits = self.sparse_index.search(query, k=k, meta_filter=meta_filter)
+        return self._get_documents([chunk_id for chunk_id, _ in hits])
+
+    def multi_query_search(self, queries: List[str], k: int = 4, use_hybrid: bool = False, fetch_k: Optional[int] = None,
+                           dense_weight: float = 0.7, sparse_weight: float = 0.3, fusion: str = "rrf",
+                           meta_filter: Optional[Dict[str, Any]] = None,
+                           prior_results: Optional[List[Document]] = None) -> List[Document]:
+        """
+        Retrieve for several queries at once and fuse the results with fuse_rankings.
+        
+        Each query is embedded with embed_query, so query-side encoding and the
+        query memo apply; the calls run concurrently on the search executor,
+        which lets the embedding batcher fold them into one forward pass. The
+        vectors go to the store as a single multi-vector query; with
+        use_hybrid the BM25 searches run concurrently on the search executor
+        too. Each query contributes one dense (and one sparse)
+        ranked list of fetch_k candidates (default k), weighted like
+        hybrid_search. prior_results, documents already retrieved for the same
+        question, join the fusion as one more dense-weighted list.
+        
+        Returns:
+            Up to k documents, best fused score first
+        """
+        queries = [q for q in dict.fromkeys(q.strip() for q in queries) if q]
+        if not queries:
+            return []
+        fetch_k = max(k, fetch_k or k)
+        
+        sparse_future = None
+        if use_hybrid:
+            self._ensure_sparse_index()
+            if len(self.sparse_index):
+                sparse_future = search_executor.submit(
+                    lambda: [self.sparse_index.search(q, k=fetch_k, meta_filter=meta_filter) for q in queries]
+                )
+        
+        docs_by_id: Dict[str, Document] = {}
+        rankings: List[Tuple[List[str], Optional[np.ndarray], float]] = []
+        if prior_results:
+            for doc in prior_results:
+                docs_by_id.setdefault(doc.metadata.get("chunk_id"), doc)
+            rankings.append(([doc.metadata.get("chunk_id") for doc in prior_results], None, dense_weight))
+        result = self.collection.query(
+            query_embeddings=list(search_executor.map(self.embedding.embed_query, queries)),
+            n_results=fetch_k,
+            where=chroma_where(meta_filter),
+            include=["distances"]
+        )
+        for ids, distances in zip(result["ids"], result["distances"]):
+            rankings.append((list(ids), -np.asarray(distances, dtype=np.float64), dense_weight))
+        
+        if sparse_future is not None:
+            for hits in sparse_future.result():
+                rankings.append(([chunk_id for chunk_id, _ in hits], np.array([score for _, score in hits]), sparse_weight))
+        
+        fused = fuse_rankings(rankings, method=fusion)[:k]
+        docs_by_id.update(self._documents_by_id([chunk_id for chunk_id, _ in fused if chunk_id not in docs_by_id]))
+        return [docs_by_id[chunk_id] for chunk_id, _ in fused if chunk_id in docs_by_id]
+
+    def hybrid_search(self, query: str, k: int = 4, fetch_k: Optional[int] = None, dense_weight: float = 0.7,
+                      sparse_weight: float = 0.3, fusion: str = "rrf",
+                      meta_filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """
+        Dense + BM25 search fused into one ranking.
+        
+        Both sides draw from a shared candidate pool of fetch_k results
+        (HYBRID_FETCH_K by default) with meta_filter applied inside each index:
+        as a Chroma where clause and as a BM25 metadata mask. The BM25 search
+        runs on the search executor while the query is embedded and searched
+        in Chroma. Results are fused with fuse_rankings, by reciprocal rank
+        ("rrf") or by min-max normalized score ("weighted"), and only the
+        documents that make the final k are loaded from the store.
+        
+        Returns:
+            Up to k documents, best fused score first
+        """
+        fetch_k = max(k, fetch_k or HYBRID_FETCH_K)
+        self._ensure_sparse_index()
+        sparse_future = None
+        if len(self.sparse_index):
+            sparse_future = search_executor.submit(self.sparse_index.search, query, fetch_k, meta_filter)
+        
+        # Candidates are fused on ids and scores alone; only the final k documents are loaded
+        rankings: List[Tuple[List[str], Optional[np.ndarray], float]] = []
+        result = self.collection.query(
+            query_embeddings=[self.embedding.embed_query(query)],
+            n_results=fetch_k,
+            where=chroma_where(meta_filter),
+            include=["distances"]
+        )
+        rankings.append((result["ids"][0], -np.asarray(result["distances"][0], dtype=np.float64), dense_weight))
+        
+        if sparse_future is not None:
+            hits = sparse_future.result()
+            rankings.append(([chunk_id for chunk_id, _ in hits], np.array([score for _, score in hits]), sparse_weight))
+        
+        return self._get_documents([chunk_id for chunk_id, _ in fuse_rankings(rankings, method=fusion)[:k]])
 
-    def as_hybrid_retriever(self, k: int = 4, sparse_k: int = 3, dense_weight: float = 0.7, sparse_weight: float = 0.3, meta_filter: Optional[Dict[str, Any]] = None):
+    def as_hybrid_retriever(self, k: int = 4, fetch_k: Optional[int] = None, dense_weight: float = 0.7, sparse_weight: float = 0.3, fusion: str = "rrf", meta_filter: Optional[Dict[str, Any]] = None):
         """
         Create a hybrid retriever that combines dense (semantic) and sparse (BM25) retrieval.
         
+        The sparse side queries the persistent BM25 index built at ingest time
+        instead of rebuilding BM25 from every stored chunk on each call.
+        
         Args:
-            k: Number of documents to retrieve for dense retrieval
-            sparse_k: Number of documents to retrieve for sparse retrieval  
-            dense_weight: Weight for dense retriever (default 0.7)
-            sparse_weight: Weight for sparse retriever (default 0.3)
+            k: Number of documents to return
+            fetch_k: Candidates fetched from each index before fusion (default HYBRID_FETCH_K)
+            dense_weight: Weight for dense retrieval (default 0.7)
+            sparse_weight: Weight for sparse retrieval (default 0.3)
+            fusion: "rrf" (reciprocal rank fusion) or "weighted" (normalized scores)
             meta_filter: Optional metadata filter
             
         Returns:
-            EnsembleRetriever combining dense and BM25 retrievers, or dense retriever if EnsembleRetriever unavailable
+            HybridSearchRetriever, or a dense retriever if there is nothing in the BM25 index
         """
-        try:
-            # Check if EnsembleRetriever is available
-            if EnsembleRetriever is None:
-                print("Warning: EnsembleRetriever not available, falling back to dense retriever")
-                return self.db.as_retriever(search_kwargs={"k": k, "filter": meta_filter} if meta_filter else {"k": k})
-
-            # Get dense retriever
-            dense_retriever = self.db.as_retriever(search_kwargs={"k": k, "filter": meta_filter} if meta_filter else {"k": k})
-            
-            # Get documents from the vector database for BM25
-            docs_data = self.db.get()
-            if not docs_data or not docs_data['documents']:
-                print("Warning: No documents found for BM25 retriever, falling back to dense only")
-                return dense_retriever
-            
-            # Create Document objects for BM25
-            documents = []
-            for i, (doc_content, metadata) in enumerate(zip(docs_data['documents'], docs_data['metadatas'])):
-                # Apply filter if provided
-                if meta_filter:
-                    match = True
-                    for key, value in meta_filter.items():
-                        if metadata.get(key) != value:
-                            match = False
-                            break
-                    if not match:
-                        continue
-                
-                documents.append(Document(
-                    page_content=doc_content,
-                    metadata=metadata
-                ))
-            
-            if not documents:
-                print("Warning: No documents match the filter criteria, falling back to dense only")
-                return dense_retriever
-            
-            # Create BM25 retriever
-            sparse_retriever = BM25Retriever.from_documents(documents)
-            sparse_retriever.k = sparse_k
-            
-            # Create ensemble retriever
-            hybrid_retriever = EnsembleRetriever(
-                retrievers=[dense_retriever, sparse_retriever],
-                weights=[dense_weight, sparse_weight]
-            )
-            
-            print(f"Created hybrid retriever with {len(documents)} documents (Dense: {dense_weight}, BM25: {sparse_weight})")
-            return hybrid_retriever
-            
-        except Exception as e:
-            print(f"Error creating hybrid retriever: {e}")
-            print("Falling back to dense retriever only")
-            return self.db.as_retriever(search_kwargs={"k": k, "filter": meta_filter} if meta_filter else {"k": k})
+        self._ensure_sparse_index()
+        if not len(self.sparse_index):
+            print("Warning: No documents found for BM25 retriever, falling back to dense only")
+            return DenseSearchRetriever(vectordb=self, k=k, search_type="similarity", meta_filter=meta_filter)
+        return HybridSearchRetriever(
+            vectordb=self, k=k, fetch_k=fetch_k, dense_weight=dense_weight,
+            sparse_weight=sparse_weight, fusion=fusion, meta_filter=meta_filter
+        )
 
     def get_retriever(self, use_hybrid: bool = False, k: int = 4, **kwargs):
         """
@@ -469,33 +1111,55 @@ class VectorDB:
         Args:
             use_hybrid: If True, returns hybrid retriever, otherwise dense retriever
             k: Number of documents to retrieve
-            **kwargs: Additional arguments for hybrid retriever (sparse_k, dense_weight, sparse_weight, meta_filter)
+            **kwargs: fetch_k and meta_filter, plus dense_weight, sparse_weight and fusion for the
+                hybrid retriever or lambda_mult for the dense (MMR) one
             
         Returns:
             Retriever instance (either dense or hybrid)
         """
         if use_hybrid:
+            kwargs.pop('lambda_mult', None)
             return self.as_hybrid_retriever(k=k, **kwargs)
         else:
-            meta_filter = kwargs.get('meta_filter')
-            return self.as_retriever(k=k, meta_filter=meta_filter)
+            return self.as_retriever(k=k, meta_filter=kwargs.get('meta_filter'), fetch_k=kwargs.get('fetch_k'),
+                                     lambda_mult=kwargs.get('lambda_mult', MMR_LAMBDA))
+
+    def iter_chunks(self, page_size: int = CHUNK_PAGE_SIZE, meta_filter: Optional[Dict[str, Any]] = None,
+                    offset: int = 0, with_content: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Page through stored chunks in storage order, page_size at a time.
+        
+        Yields {"chunk_id", "metadata"} (plus "content" with with_content), so
+        only one page is held in memory and chunk texts are not loaded unless
+        asked for. Pages are read by offset, so chunks written or removed while
+        iterating may be skipped or seen twice.
+        """
+        include = ["metadatas", "documents"] if with_content else ["metadatas"]
+        page_size = max(1, page_size)
+        while True:
+            page = self.collection.get(where=chroma_where(meta_filter), limit=page_size, offset=offset, include=include)
+            for n, chunk_id in enumerate(page["ids"]):
+                chunk = {"chunk_id": chunk_id, "metadata": page["metadatas"][n] or {}}
+                if with_content:
+                    chunk["content"] = page["documents"][n]
+                yield chunk
+            if len(page["ids"]) < page_size:
+                return
+            offset += page_size
 
-    def view_chunks(self, limit=10):
+    def view_chunks(self, limit=10, offset=0, meta_filter: Optional[Dict[str, Any]] = None):
         try:
-            docs = self.db.get()
-            
-            print(f"\nTotal chunks in vector store: {len(docs['documents'])}")
+            print(f"\nTotal chunks in vector store: {self._stored_chunk_count()}")
             print("="*80)
             
-            if len(docs['documents']) == 0:
-                print("No chunks found in vector store!")
-                return
-            
-            for i in range(min(limit, len(docs['documents']))):
-                content = docs['documents'][i]
-                metadata = docs['metadatas'][i]
+            shown = 0
+            chunks = self.iter_chunks(page_size=min(max(1, limit), CHUNK_PAGE_SIZE), meta_filter=meta_filter, offset=offset, with_content=True)
+            for i, chunk in enumerate(itertools.islice(chunks, limit), offset + 1):
+                content = chunk["content"]
+                metadata = chunk["metadata"]
+                shown += 1
                 
-                print(f"\nChunk {i+1}:")
+                print(f"\nChunk {i}:")
                 print(f"  Chunk ID: {metadata.get('chunk_id', 'N/A')}")
                 print(f"  File: {metadata.get('filename', 'N/A')}")
                 print(f"  Category: {metadata.get('category', 'N/A')}")
@@ -504,40 +1168,36 @@ class VectorDB:
                 print("-" * 40)
                 print(content[:200] + "..." if len(content) > 200 else content)
                 print("="*80)
+            
+            if not shown:
+                print("No chunks found in vector store!")
                 
         except Exception as e:
             print(f"Error viewing chunks: {e}")
             import traceback
             traceback.print_exc()
 
-    def get_stats(self):
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Chunk counts per file, category and chunking method from the registry's
+        running aggregates, plus the number of chunks actually stored (the
+        registry's count again for a tenant of a shared collection).
+        """
         try:
-            docs = self.db.get()
-            total_chunks = len(docs['documents'])
+            stats = copy.deepcopy(self.reg["stats"])
+            stats["stored_chunks"] = self._stored_chunk_count()
             
             print(f"\n=== Vector Store Statistics ===")
-            print(f"Total chunks: {total_chunks}")
+            print(f"Total chunks: {stats['total_chunks']}")
             
-            if total_chunks > 0:
-                # Count by chunking method
-                chunking_methods = {}
-                categories = {}
-                files = {}
-                
-                for metadata in docs['metadatas']:
-                    method = metadata.get('chunking_method', 'unknown')
-                    chunking_methods[method] = chunking_methods.get(method, 0) + 1
-                    
-                    category = metadata.get('category', 'unknown')
-                    categories[category] = categories.get(category, 0) + 1
-                    
-                    filename = metadata.get('filename', 'unknown')
-                    files[filename] = files.get(filename, 0) + 1
-                
-                print(f"Files: {len(files)}")
-                print(f"Chunking methods: {dict(chunking_methods)}")
-                print(f"Categories: {dict(categories)}")
-                print(f"Files processed: {list(files.keys())}")
+            if stats["total_chunks"] > 0:
+                print(f"Files: {len(stats['files'])}")
+                print(f"Chunking methods: {stats['chunking_methods']}")
+                print(f"Categories: {stats['categories']}")
+                print(f"Files processed: {list(stats['files'].keys())}")
+            if stats["stored_chunks"] != stats["total_chunks"]:
+                print(f"Warning: store holds {stats['stored_chunks']} chunks, registry counts {stats['total_chunks']}")
+            return stats
             
         except Exception as e:
-            print(f"Error getting stats: {e}")
\ No newline at end of file
+            print(f"Error getting stats: {e}")
@@ -5,19 +5,27 @@ from auth.validators import is_valid_email, is_strong_password
 from auth.jwt_handler import create_token, verify_token
 from utils.file_ops import load_users, save_users
 from utils.token_blacklist import blacklist_token, is_token_blacklisted
+from utils.job_queue import JobQueue, JobQueueFull
+from utils.single_flight import SingleFlight
 from werkzeug.utils import secure_filename
 import os
+import json
 import time
 import shutil
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from ai.constant import *
 from ai.llm import LLM
-from ai.vectorstore import VectorDB
-from ai.normal_chain import build_rag_chain
+from ai.vectorstore import VectorDB, check_dense_backend, index_config, is_index_current, release_chroma_system
+from ai.queryenhancements import queryDecompose, queryExpansion, novel_terms, parse_sub_queries
+from ai.enhancement_cache import EnhancementCache, normalize_question
+from ai.answer_cache import AnswerCache
+from ai.vectordb_pool import VectorDBPool
+from ai.tenant_store import SharedCollectionStore
+from ai.normal_chain import build_rag_chain, build_answer_chain, pack_context
 from ai.embed import Embedder
-from ai.reranker import Reranker
-import importlib
-import ai.reranker
+from ai.embedding_cache import EmbeddingCache
+from ai.reranker import RerankerRegistry
 
 app = Flask(__name__, static_folder='../Frontend/dist', static_url_path='')
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -31,13 +39,44 @@ UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
 llm_instance = None
 vdb_instance = None
 emb_instance = None
+embedder = None
+embedding_cache = None
+enhancement_cache = None
+answer_cache = None
+shared_store = None
+query_enhancers = {"expansion": queryExpansion(), "decomposition": queryDecompose()}
+reranker_registry = RerankerRegistry()
 
 user_processing_status = {}
+ingest_jobs = JobQueue(max_workers=INGEST_WORKERS, max_pending=INGEST_MAX_PENDING)
+query_flights = SingleFlight(wait_timeout=QUERY_COALESCING_TIMEOUT)
+enhancement_executor = ThreadPoolExecutor(max_workers=ENHANCEMENT_WORKERS, thread_name_prefix="enhance")
+
+def get_user_db_dir(email):
+    user_dir = email.replace('@', '_at_').replace('.', '_')
+    if STORAGE_MODE == "shared":
+        # Only the user's registry and BM25 index; chunks live in the shared collection
+        return f"{SHARED_DB_DIR}/tenants/{user_dir}"
+    return f"./db/{user_dir}"
 
 def cleanup_user_data(email, force=False):
     """Clean up vector DB and registry for a user"""
     try:
-        user_db_dir = f"./db/{email.replace('@', '_at_').replace('.', '_')}"
+        user_db_dir = get_user_db_dir(email)
+        
+        # Drop pooled handles, Chroma's cached system and cached answers before the files go away
+        vdb_pool.invalidate(email)
+        if answer_cache:
+            answer_cache.invalidate(email)
+        
+        if shared_store is not None:
+            # A filtered delete on the user's shard instead of removing a Chroma directory
+            shared_store.delete_tenant(email)
+            shutil.rmtree(user_db_dir, ignore_errors=True)
+            print(f"âœ“ Deleted {email}'s chunks from the shared collection")
+            return True
+        
+        release_chroma_system(user_db_dir)
         
         if not os.path.exists(user_db_dir):
             print(f"No database to clean for {email}")
@@ -104,18 +143,55 @@ def cleanup_user_data(email, force=False):
         print(f"âœ— Error in cleanup_user_data: {e}")
         return False
 
+def run_cleanup_job(job, email):
+    """Wipe a user's vector DB and registry on the ingest job pool, once their previous job has stopped."""
+    if not cleanup_user_data(email, force=True):
+        raise Exception("Failed to cleanup old vector database")
+
+def cleanup_user_data_when_idle(email):
+    """
+    Cancel the user's ingest job and clean up their data without blocking the request.
+
+    Cleans up right away when no job is running. Otherwise the cancelled job
+    may still be writing to the index, so the cleanup is queued to run after
+    it. Returns cleanup_user_data's result, or None if the cleanup was queued.
+    Raises JobQueueFull if it cannot be queued.
+    """
+    active_job = ingest_jobs.active_job(email)
+    if not active_job or active_job.finished:
+        return cleanup_user_data(email, force=True)
+    ingest_jobs.submit(email, run_cleanup_job, email)
+    print(f"Cleanup for {email} queued behind the cancelled job {active_job.id}")
+    return None
+
 def initialize_rag_system():
-    global llm_instance, vdb_instance, emb_instance
+    global llm_instance, vdb_instance, emb_instance, embedder, embedding_cache, enhancement_cache, answer_cache, shared_store
+    # Fail at startup, not on the first upload or query, if the storage settings cannot work together
+    if STORAGE_MODE not in ("per_user", "shared"):
+        raise ValueError(f"Unknown STORAGE_MODE: {STORAGE_MODE} (expected 'per_user' or 'shared')")
+    check_dense_backend(DENSE_BACKEND, shared=(STORAGE_MODE == "shared"))
     llm_instance = LLM(LLMNAME)
-    emb_instance = Embedder(EMBEDNAME).emb
+    embedder = Embedder(EMBEDNAME)
+    emb_instance = embedder.emb
+    embedding_cache = EmbeddingCache(EMBED_CACHE_PATH, max_entries=EMBED_CACHE_MAX_ENTRIES)
+    enhancement_cache = EnhancementCache(ENHANCEMENT_CACHE_MAX_ENTRIES, ttl=ENHANCEMENT_CACHE_TTL, path=ENHANCEMENT_CACHE_PATH,
+                                         flush_interval=ENHANCEMENT_CACHE_FLUSH_INTERVAL)
+    if ANSWER_CACHE_ENABLED:
+        answer_cache = AnswerCache(ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL)
+    if STORAGE_MODE == "shared":
+        shared_store = SharedCollectionStore(SHARED_DB_DIR, shards=TENANT_SHARDS, collection_name=COLLECTION)
+    reranker_registry.preload(DEFAULT_RERANKER)
     print("RAG system components initialized successfully")
 
 def get_user_rag_db(email, semantic=False):
-    user_db_dir = f"./db/{email.replace('@', '_at_').replace('.', '_')}"
+    user_db_dir = get_user_db_dir(email)
     user_registry = f"{user_db_dir}/registry.json"
-    vdb = VectorDB(embedding=emb_instance, persist_directory=user_db_dir, batch_size=CHUNK_SIZE, semantic=semantic, registry_path=user_registry)
+    vdb = VectorDB(embedding=emb_instance, persist_directory=user_db_dir, batch_size=CHUNK_SIZE, semantic=semantic, registry_path=user_registry, embedding_cache=embedding_cache,
+                   tenant_store=shared_store, tenant_id=email)
     return vdb
 
+vdb_pool = VectorDBPool(get_user_rag_db, max_size=VDB_POOL_MAX_SIZE, idle_timeout=VDB_POOL_IDLE_TIMEOUT)
+
 def get_user_folder(email):
     user_folder = UPLOAD_FOLDER / email.replace('@', '_at_').replace('.', '_')
     user_folder.mkdir(exist_ok=True)
@@ -228,10 +304,13 @@ def signout():
                     print(f"âš  Error deleting user files: {e}")
             
             # Clean up vector DB and registry (force cleanup)
-            cleanup_success = cleanup_user_data(email, force=True)
+            try:
+                cleanup_success = cleanup_user_data_when_idle(email)
+            except JobQueueFull:
+                cleanup_success = False
             if cleanup_success:
                 print(f"âœ“ Cleaned up vector DB for {email}")
-            else:
+            elif cleanup_success is False:
                 print(f"âš  Partial cleanup for {email}")
             
             # Clear processing status
@@ -351,6 +430,10 @@ def upload_files():
         if not files or len(files) == 0:
             return jsonify({"error": "No files provided", "success": False}), 400
         
+        # A new upload supersedes any document still being processed
+        if ingest_jobs.cancel(email):
+            print(f"Cancelled in-flight processing for {email}")
+        
         user_folder = get_user_folder(email)
         existing_files = list(user_folder.glob("*.pdf"))
         
@@ -362,9 +445,12 @@ def upload_files():
             if email in user_processing_status:
                 del user_processing_status[email]
             
-            # Clean up vector DB and registry (force cleanup)
-            cleanup_success = cleanup_user_data(email, force=True)
-            if not cleanup_success:
+            # Clean up vector DB and registry (force cleanup), after the cancelled job if one is still running
+            try:
+                cleanup_success = cleanup_user_data_when_idle(email)
+            except JobQueueFull:
+                return jsonify({"error": "Server is busy processing other documents. Please try again shortly.", "success": False}), 503
+            if cleanup_success is False:
                 return jsonify({
                     "error": "Failed to cleanup existing data. Please try again in a few seconds.",
                     "success": False
@@ -461,11 +547,14 @@ def delete_file(filename):
         if email in user_processing_status:
             del user_processing_status[email]
         
-        # Clean up vector DB and registry
+        # Clean up vector DB and registry, after the cancelled job if one is still running
         print(f"Cleaning up vector database for {email}...")
-        cleanup_success = cleanup_user_data(email, force=True)
+        try:
+            cleanup_success = cleanup_user_data_when_idle(email)
+        except JobQueueFull:
+            return jsonify({"error": "Server is busy processing other documents. Please try again shortly.", "success": False}), 503
         
-        if not cleanup_success:
+        if cleanup_success is False:
             print(f"âš  Warning: Cleanup partially failed, but file was deleted")
         
         return jsonify({"success": True, "message": "File and associated data deleted"}), 200
@@ -483,18 +572,115 @@ def get_rag_status():
         if not email:
             return jsonify({"error": "Unauthorized"}), 401
         status = user_processing_status.get(email, {})
+        job = ingest_jobs.get(status["job_id"]) if status.get("job_id") else None
         return jsonify({
             "status": status.get("status", "not_started"),
             "chunking_method": status.get("chunking_method", "standard"),
             "hybrid_search": status.get("hybrid_search", False),
             "use_reranker": status.get("use_reranker", False),
             "query_enhancement_mode": status.get("query_enhancement_mode", "normal"),
-            "message": status.get("message", "")
+            "message": status.get("message", ""),
+            "job": job.to_dict() if job else None
         }), 200
     except Exception as e:
         print("RAG status error:", e)
         return jsonify({"error": "Internal server error"}), 500
 
+def run_processing_job(job, email, pdf_path, chunking_method, hybrid_search, use_reranker, query_enhancement_mode, settings_text):
+    """Rebuild a user's vector DB from their PDF. Runs on the ingest job pool, not in the request."""
+    def set_status(status, message):
+        # Once cancelled, the newer job (or the upload/delete that cancelled us) owns the status
+        if job.cancelled or user_processing_status.get(email, {}).get("job_id") != job.id:
+            return
+        user_processing_status[email] = {
+            "status": status,
+            "chunking_method": chunking_method,
+            "hybrid_search": hybrid_search,
+            "use_reranker": use_reranker,
+            "query_enhancement_mode": query_enhancement_mode,
+            "message": message,
+            "job_id": job.id
+        }
+
+    try:
+        print(f"\n{'='*60}")
+        print(f"Starting document processing for {email} (job {job.id})")
+        print(f"{'='*60}")
+        set_status("processing", f"Processing with {settings_text}...")
+        
+        # Clean vector database and registry before processing (with force flag)
+        print("Step 1: Cleaning up old vector database...")
+        cleanup_success = cleanup_user_data(email, force=True)
+        
+        if not cleanup_success:
+            raise Exception("Failed to cleanup old vector database. Please try again.")
+        
+        print("âœ“ Cleanup successful")
+        time.sleep(2)  # Wait for file system to stabilize
+        
+        # Create new vector database
+        print("Step 2: Creating new vector database...")
+        semantic = (chunking_method == "semantic")
+        user_vdb = None
+        
+        try:
+            user_vdb = get_user_rag_db(email, semantic=semantic)
+            print("âœ“ Vector database created")
+            
+            # Process the PDF
+            print("Step 3: Processing PDF file...")
+            # Ingestion persists the index, BM25 index and registry once the last batch is written
+            user_vdb.ingest_file_incremental(pdf_path, on_progress=job.update_progress, should_cancel=lambda: job.cancelled)
+            print("âœ“ PDF processed and persisted successfully")
+            
+        except Exception as processing_error:
+            print(f"âœ— Error during processing: {processing_error}")
+            raise processing_error
+            
+        finally:
+            # Always close the database connection
+            if user_vdb:
+                try:
+                    print("Step 4: Closing database connection...")
+                    user_vdb.close()
+                    del user_vdb
+                    print("âœ“ Database connection closed")
+                    time.sleep(1)  # Wait for cleanup
+                except Exception as close_error:
+                    print(f"âš  Warning during close: {close_error}")
+        
+        # Update status to ready
+        set_status("ready", f"Document processed successfully with {settings_text}")
+        
+        print(f"\n{'='*60}")
+        print(f"âœ“ Processing completed successfully for {email}")
+        print(f"{'='*60}\n")
+        
+    except Exception as processing_error:
+        if job.cancelled:
+            print(f"Processing cancelled for {email} (job {job.id})")
+            raise
+        
+        error_msg = str(processing_error)
+        print(f"\n{'='*60}")
+        print(f"âœ— Processing failed for {email}")
+        print(f"Error: {error_msg}")
+        print(f"{'='*60}\n")
+        
+        # Clean up on error
+        print("Cleaning up after error...")
+        cleanup_user_data(email, force=True)
+        
+        # Update status to error with a user-friendly hint
+        if "readonly database" in error_msg.lower():
+            hint = " Database is locked. Please wait a moment and try again."
+        elif "permission" in error_msg.lower():
+            hint = " Permission error. Please try uploading the file again."
+        else:
+            hint = ""
+        set_status("error", f"Processing failed: {error_msg}{hint}")
+        raise
+
 @app.route("/process-document", methods=["POST"])
 def process_document():
     email = None
@@ -515,124 +701,55 @@ def process_document():
         if not pdf_files:
             return jsonify({"error": "No PDF file found. Please upload a file first.", "success": False}), 400
         
-        # Set processing status
         search_type = "hybrid search" if hybrid_search else "dense search"
         enhancement_text = ""
         if query_enhancement_mode == "expansion":
             enhancement_text = ", query expansion"
         elif query_enhancement_mode == "decomposition":
             enhancement_text = ", query decomposition"
+        settings_text = f"{chunking_method} chunking, {search_type}, {'reranking' if use_reranker else 'no reranking'}{enhancement_text}"
         
-        user_processing_status[email] = {
-            "status": "processing",
-            "chunking_method": chunking_method,
-            "hybrid_search": hybrid_search,
-            "use_reranker": use_reranker,
-            "query_enhancement_mode": query_enhancement_mode,
-            "message": f"Processing with {chunking_method} chunking, {search_type}, {'reranking' if use_reranker else 'no reranking'}{enhancement_text}..."
-        }
-        
-        try:
-            print(f"\n{'='*60}")
-            print(f"Starting document processing for {email}")
-            print(f"{'='*60}")
-            
-            # Clean vector database and registry before processing (with force flag)
-            print("Step 1: Cleaning up old vector database...")
-            cleanup_success = cleanup_user_data(email, force=True)
-            
-            if not cleanup_success:
-                raise Exception("Failed to cleanup old vector database. Please try again.")
-            
-            print("âœ“ Cleanup successful")
-            time.sleep(2)  # Wait for file system to stabilize
-            
-            # Create new vector database
-            print("Step 2: Creating new vector database...")
-            semantic = (chunking_method == "semantic")
-            user_vdb = None
-            
-            try:
-                user_vdb = get_user_rag_db(email, semantic=semantic)
-                print("âœ“ Vector database created")
-                
-                # Process the PDF
-                print("Step 3: Processing PDF file...")
-                pdf_file = pdf_files[0]
-                user_vdb.ingest_file_incremental(str(pdf_file))
-                print("âœ“ PDF processed successfully")
-                
-                # Persist the database
-                print("Step 4: Persisting vector database...")
-                user_vdb.persist()
-                print("âœ“ Database persisted")
-                
-            except Exception as processing_error:
-                print(f"âœ— Error during processing: {processing_error}")
-                raise processing_error
-                
-            finally:
-                # Always close the database connection
-                if user_vdb:
-                    try:
-                        print("Step 5: Closing database connection...")
-                        user_vdb.close()
-                        del user_vdb
-                        print("âœ“ Database connection closed")
-                        time.sleep(1)  # Wait for cleanup
-                    except Exception as close_error:
-                        print(f"âš  Warning during close: {close_error}")
-            
-            # Update status to ready
+        # Search, reranking and query enhancement only matter at query time, so an
+        # index built from the same file with the same chunking/embedding is reused
+        pdf_path = str(pdf_files[0])
+        semantic = (chunking_method == "semantic")
+        active_job = ingest_jobs.active_job(email)
+        user_registry = f"{get_user_db_dir(email)}/registry.json"
+        if (not active_job or active_job.finished) and is_index_current(user_registry, pdf_path, index_config(semantic, emb_instance)):
             user_processing_status[email] = {
                 "status": "ready",
                 "chunking_method": chunking_method,
                 "hybrid_search": hybrid_search,
                 "use_reranker": use_reranker,
                 "query_enhancement_mode": query_enhancement_mode,
-                "message": f"Document processed successfully with {chunking_method} chunking, {search_type}, {'reranking' if use_reranker else 'no reranking'}{enhancement_text}"
+                "message": f"Document ready with {settings_text} (existing index reused)"
             }
-            
-            print(f"\n{'='*60}")
-            print(f"âœ“ Processing completed successfully for {email}")
-            print(f"{'='*60}\n")
-            
-            return jsonify({"success": True, "message": "Document processed successfully"}), 200
-            
-        except Exception as processing_error:
-            error_msg = str(processing_error)
-            print(f"\n{'='*60}")
-            print(f"âœ— Processing failed for {email}")
-            print(f"Error: {error_msg}")
-            print(f"{'='*60}\n")
-            
-            # Clean up on error
-            print("Cleaning up after error...")
-            cleanup_user_data(email, force=True)
-            
-            # Update status to error
+            print(f"âœ“ Reused existing index for {email}, settings updated")
+            return jsonify({"success": True, "message": "Settings updated, existing index reused", "reused_index": True}), 200
+        
+        # Submitting cancels the user's previous job; the new one starts (and wipes the database) only once it has stopped
+        def set_queued(job):
+            # Written before the job can start, so its own status updates (matched on job_id) are never lost
             user_processing_status[email] = {
-                "status": "error",
+                "status": "processing",
                 "chunking_method": chunking_method,
                 "hybrid_search": hybrid_search,
                 "use_reranker": use_reranker,
                 "query_enhancement_mode": query_enhancement_mode,
-                "message": f"Processing failed: {error_msg}"
+                "message": f"Queued for processing with {settings_text}...",
+                "job_id": job.id
             }
-            
-            # Return user-friendly error message
-            if "readonly database" in error_msg.lower():
-                error_response = "Database is locked. Please wait a moment and try again."
-            elif "permission" in error_msg.lower():
-                error_response = "Permission error. Please try uploading the file again."
-            else:
-                error_response = "Document processing failed. Please try again."
-            
-            return jsonify({
-                "error": error_response,
-                "success": False,
-                "details": error_msg if app.debug else None
-            }), 500
+
+        try:
+            job = ingest_jobs.submit(
+                email, run_processing_job, email, pdf_path,
+                chunking_method, hybrid_search, use_reranker, query_enhancement_mode, settings_text,
+                on_created=set_queued
+            )
+        except JobQueueFull:
+            return jsonify({"error": "Server is busy processing other documents. Please try again shortly.", "success": False}), 503
+        
+        return jsonify({"success": True, "message": "Document processing started", "job_id": job.id}), 202
 
     except Exception as e:
         print(f"âœ— Process document error: {e}")
@@ -650,129 +767,412 @@ def process_document():
         }), 500
 
 
+def enhance_query(question, query_enhancement_mode):
+    """
+    Rewrite the question for retrieval; falls back to the original question on failure.
+    Successful rewrites are cached per (LLM model, mode, normalized question).
+    """
+    enhancer = query_enhancers.get(query_enhancement_mode)
+    if enhancer is None:
+        return question
+    model_name = getattr(llm_instance, "model_name", LLMNAME)
+    if enhancement_cache:
+        cached = enhancement_cache.get(model_name, query_enhancement_mode, question)
+        if cached is not None:
+            return cached
+    try:
+        enhanced_query = enhancer.expand_query(question, llm_instance.llm)
+    except Exception as enhancement_error:
+        print(f"âš  Query enhancement failed: {enhancement_error}, using original query")
+        return question
+    if enhancement_cache:
+        enhancement_cache.put(model_name, query_enhancement_mode, question, enhanced_query)
+    return enhanced_query
+
+def retrieval_queries(question, enhanced_query, query_enhancement_mode):
+    """
+    Queries to retrieve with. Expansion/decomposition output is split into its
+    individual sub-queries (plus the original question) for multi-query retrieval.
+    """
+    if not MULTI_QUERY_RETRIEVAL or query_enhancement_mode not in ("expansion", "decomposition") or enhanced_query == question:
+        return [enhanced_query]
+    sub_queries = [q for q in parse_sub_queries(enhanced_query, MULTI_QUERY_MAX_QUERIES) if q.lower() != question.lower()]
+    return [question] + sub_queries
+
+def parse_search_options(data):
+    """Per-request retrieval overrides (k, fetch_k, dense_weight, sparse_weight, fusion, lambda_mult). Returns (options, error)."""
+    options = {}
+    for name, cast, low, high in (("k", int, 1, 50), ("fetch_k", int, 1, 200), ("dense_weight", float, 0.0, 1.0), ("sparse_weight", float, 0.0, 1.0), ("lambda_mult", float, 0.0, 1.0)):
+        if data.get(name) is None:
+            continue
+        try:
+            value = cast(data[name])
+        except (TypeError, ValueError):
+            return None, f"{name} must be a number"
+        if not low <= value <= high:
+            return None, f"{name} must be between {low} and {high}"
+        options[name] = value
+    if data.get("fusion") is not None:
+        if data["fusion"] not in ("rrf", "weighted"):
+            return None, "fusion must be 'rrf' or 'weighted'"
+        options["fusion"] = data["fusion"]
+    return options, None
+
+def retrieval_settings(status):
+    """Returns (k, extra search kwargs) from the user's settings and any per-request search options."""
+    options = dict(status.get("search_options") or {})
+    k = options.pop("k", 8 if status.get("use_reranker", False) else 4)
+    return k, options
+
+def fusion_kwargs(search_kwargs):
+    """multi_query_search fuses ranked lists instead of running MMR, so lambda_mult does not apply."""
+    return {name: value for name, value in search_kwargs.items() if name != "lambda_mult"}
+
+def retrieve_documents(email, status, query, queries=None):
+    """
+    Retrieve (and optionally rerank) context documents with the user's processing options.
+    
+    With several queries (see retrieval_queries) all of them are searched in one
+    fused multi-query pass and reranking scores against the first, the original question.
+    
+    Returns:
+        (docs, retrieval stats dict: MMR stage timings when a dense MMR search ran)
+    """
+    hybrid_search = status.get("hybrid_search", False)
+    semantic = (status.get("chunking_method", "standard") == "semantic")
+    k, search_kwargs = retrieval_settings(status)
+    
+    with vdb_pool.lease(email, semantic) as user_vdb:
+        if queries and len(queries) > 1:
+            retrieved_docs = user_vdb.multi_query_search(queries, k=k, use_hybrid=hybrid_search, **fusion_kwargs(search_kwargs))
+            query = queries[0]
+            stats = {}
+        else:
+            retriever = user_vdb.get_retriever(use_hybrid=hybrid_search, k=k, **search_kwargs)
+            retrieved_docs = retriever.invoke(query)
+            stats = dict(getattr(retriever, "timings", {}))
+    
+    return rerank_documents(status, query, retrieved_docs), stats
+
+def rerank_documents(status, query, retrieved_docs):
+    # Apply reranking if enabled
+    if status.get("use_reranker", False) and retrieved_docs:
+        try:
+            reranker = reranker_registry.get(DEFAULT_RERANKER)
+            retrieved_docs = reranker.rerank_docs(query, retrieved_docs, top_k=4)
+        except Exception as rerank_error:
+            print(f"âš  Reranking failed: {rerank_error}, using non-reranked docs")
+    
+    return retrieved_docs
+
+def speculative_retrieve(email, status, question, query_enhancement_mode):
+    """
+    Overlap retrieval with the query enhancement LLM call.
+    
+    Retrieval for the raw question starts while the enhancement runs on
+    enhancement_executor. Once the enhanced query arrives, only its novel terms
+    (per sub-query, see retrieval_queries) are searched and fused with the raw
+    results. If enhancement misses SPECULATIVE_ENHANCEMENT_DEADLINE seconds the
+    raw results are used alone.
+    
+    Returns:
+        (enhanced_query, queries, reranked docs, speculation info dict, retrieval stats dict)
+    """
+    hybrid_search = status.get("hybrid_search", False)
+    semantic = (status.get("chunking_method", "standard") == "semantic")
+    k, search_kwargs = retrieval_settings(status)
+    started = time.perf_counter()
+    enhancement = enhancement_executor.submit(enhance_query, question, query_enhancement_mode)
+    
+    with vdb_pool.lease(email, semantic) as user_vdb:
+        retriever = user_vdb.get_retriever(use_hybrid=hybrid_search, k=k, **search_kwargs)
+        raw_docs = retriever.invoke(question)
+        raw_done = time.perf_counter()
+        try:
+            enhanced_query = enhancement.result(timeout=max(0.0, SPECULATIVE_ENHANCEMENT_DEADLINE - (raw_done - started)))
+            timed_out = False
+        except FuturesTimeout:
+            print(f"âš  Query enhancement missed the {SPECULATIVE_ENHANCEMENT_DEADLINE}s deadline, using raw-question results")
+            enhanced_query, timed_out = question, True
+        
+        queries = retrieval_queries(question, enhanced_query, query_enhancement_mode)
+        follow_up = [] if enhanced_query == question else [
+            terms for terms in dict.fromkeys(novel_terms(question, q) for q in (queries[1:] or [enhanced_query])) if terms
+        ]
+        docs = raw_docs
+        if follow_up:
+            docs = user_vdb.multi_query_search(follow_up, k=k, use_hybrid=hybrid_search, prior_results=raw_docs, **fusion_kwargs(search_kwargs))
+    
+    info = {
+        "enhancement_timed_out": timed_out,
+        "novel_term_queries": follow_up,
+        "overlap_saved_ms": round((raw_done - started) * 1000, 1) if not timed_out else None
+    }
+    return enhanced_query, queries, rerank_documents(status, question, docs), info, dict(getattr(retriever, "timings", {}))
+
+def enhance_and_retrieve(email, status, question, query_enhancement_mode, speculative):
+    """Enhance the question and retrieve context. Returns (enhanced_query, queries, docs, speculation info or None, retrieval stats)."""
+    if speculative and query_enhancement_mode in ("expansion", "decomposition"):
+        return speculative_retrieve(email, status, question, query_enhancement_mode)
+    enhanced_query = enhance_query(question, query_enhancement_mode)
+    queries = retrieval_queries(question, enhanced_query, query_enhancement_mode)
+    docs, stats = retrieve_documents(email, status, enhanced_query, queries)
+    return enhanced_query, queries, docs, None, stats
+
+def query_metadata(status, question, enhanced_query, query_enhancement_mode, queries=None):
+    use_reranker = status.get("use_reranker", False)
+    return {
+        "retrieval_queries": queries if queries and len(queries) > 1 else None,
+        "retrieval_method": "Hybrid (Dense + BM25)" if status.get("hybrid_search", False) else "Dense Only",
+        "chunking_method": status.get("chunking_method", "standard"),
+        "reranker_used": use_reranker,
+        "reranker_type": DEFAULT_RERANKER if use_reranker else None,
+        "query_enhancement_mode": query_enhancement_mode,
+        "enhanced_query": enhanced_query if enhanced_query != question else None,
+        "search_options": status.get("search_options") or None
+    }
+
+def retrieval_scope(email, status, query_enhancement_mode):
+    """
+    Identifies the indexed documents and the settings an answer is produced with.
+
+    Documents are keyed by filename and doc_id as well as content hash: the
+    answer payload's context headers name them, so users only share a
+    coalesced answer when those headers would be identical for both.
+    """
+    semantic = (status.get("chunking_method", "standard") == "semantic")
+    with vdb_pool.lease(email, semantic) as user_vdb:
+        documents = tuple(sorted(
+            (d.get("filename", ""), d.get("doc_id", ""), d.get("content_hash", ""))
+            for d in user_vdb.reg.get("docs", {}).values()
+        ))
+    return (
+        documents,
+        status.get("chunking_method", "standard"),
+        status.get("hybrid_search", False),
+        status.get("use_reranker", False),
+        query_enhancement_mode,
+        getattr(llm_instance, "model_name", LLMNAME),
+        tuple(sorted((status.get("search_options") or {}).items()))
+    )
+
+def query_error_response(email, e):
+    error_msg = str(e)
+    print(f"âœ— Query error: {error_msg}")
+    import traceback
+    traceback.print_exc()
+    
+    # Attempt cleanup if database is corrupted
+    if "database" in error_msg.lower() and email:
+        print(f"Database error detected, attempting cleanup for {email}")
+        vdb_pool.invalidate(email)
+        if email in user_processing_status:
+            user_processing_status[email]["status"] = "error"
+    
+    return jsonify({
+        "error": "Failed to process query. Please try again or reprocess your document.",
+        "success": False,
+        "details": error_msg if app.debug else None
+    }), 500
+
+def parse_query_request(email):
+    """Validate a /query style request. Returns (status, question, mode, None) or (.., error response)."""
+    status = user_processing_status.get(email, {})
+    if status.get("status") != "ready":
+        return status, None, None, (jsonify({
+            "error": "Document not ready. Please process the document first.",
+            "success": False
+        }), 400)
+    
+    data = request.get_json()
+    question = data.get("question", "").strip()
+    query_enhancement_mode = data.get("query_enhancement_mode", status.get("query_enhancement_mode", "normal"))
+    
+    if not question:
+        return status, None, None, (jsonify({"error": "Question is required", "success": False}), 400)
+    
+    search_options, options_error = parse_search_options(data)
+    if options_error:
+        return status, None, None, (jsonify({"error": options_error, "success": False}), 400)
+    return {**status, "search_options": search_options}, question, query_enhancement_mode, None
+
+def answer_question(email, status, question, query_enhancement_mode, speculative):
+    """Run the full enhance, retrieve, rerank and answer pipeline. Returns the /query response payload."""
+    # Use enhanced query (or its sub-queries) for retrieval
+    enhanced_query, queries, retrieved_docs, speculation, retrieval_stats = enhance_and_retrieve(
+        email, status, question, query_enhancement_mode, speculative
+    )
+    
+    # Create custom retriever
+    class CustomRetriever:
+        def __init__(self, docs):
+            self.docs = docs
+        def invoke(self, query):
+            return self.docs
+    
+    custom_retriever = CustomRetriever(retrieved_docs)
+    rag_chain = build_rag_chain(llm_instance, custom_retriever)
+    
+    # Use enhanced query for answer generation
+    result = rag_chain.invoke(enhanced_query)
+    
+    return {
+        "success": True,
+        "answer": result["answer"],
+        "context": result["context_text"],
+        "source_docs": len(result["context_docs"]),
+        "context_stats": result["context_stats"],
+        "retrieval_stats": retrieval_stats or None,
+        "speculation": speculation,
+        **query_metadata(status, question, enhanced_query, query_enhancement_mode, queries)
+    }
+
 @app.route("/query", methods=["POST"])
 def query_document():
     email = None
-    user_vdb = None
     try:
         email = get_user_from_token(request.headers.get("Authorization"))
         if not email:
             return jsonify({"error": "Unauthorized", "success": False}), 401
         
-        # Check if document is processed
-        status = user_processing_status.get(email, {})
-        if status.get("status") != "ready":
-            return jsonify({
-                "error": "Document not ready. Please process the document first.",
-                "success": False
-            }), 400
+        status, question, query_enhancement_mode, error_response = parse_query_request(email)
+        if error_response:
+            return error_response
         
-        data = request.get_json()
-        question = data.get("question", "").strip()
-        query_enhancement_mode = data.get("query_enhancement_mode", status.get("query_enhancement_mode", "normal"))
+        scope = retrieval_scope(email, status, query_enhancement_mode)
+        speculative = request.get_json().get("speculative_retrieval", SPECULATIVE_RETRIEVAL)
         
-        if not question:
-            return jsonify({"error": "Question is required", "success": False}), 400
+        question_vector = None
+        if answer_cache:
+            try:
+                question_vector = emb_instance.embed_query(question)
+                cached = answer_cache.lookup(email, scope, question_vector)
+                if cached:
+                    payload, similarity = cached
+                    return jsonify({**payload, "cached": True, "coalesced": False, "cache_similarity": round(similarity, 4)}), 200
+            except Exception as cache_error:
+                print(f"âš  Answer cache lookup failed: {cache_error}")
+                question_vector = None
         
-        # Apply query enhancement
-        enhanced_query = question
-        try:
-            if query_enhancement_mode == "expansion":
-                from ai.queryenhancements import queryExpansion
-                expander = queryExpansion()
-                enhanced_query = expander.expand_query(question, llm_instance.llm)
-            elif query_enhancement_mode == "decomposition":
-                from ai.queryenhancements import queryDecompose
-                decomposer = queryDecompose()
-                enhanced_query = decomposer.expand_query(question, llm_instance.llm)
-        except Exception as enhancement_error:
-            print(f"âš  Query enhancement failed: {enhancement_error}, using original query")
-            enhanced_query = question
-        
-        chunking_method = status.get("chunking_method", "standard")
-        hybrid_search = status.get("hybrid_search", False)
-        use_reranker = status.get("use_reranker", False)
+        # Identical concurrent questions against the same content and settings share one run.
+        # The enhanced query is a function of (model, mode, normalized question) via the
+        # enhancement cache, so the normalized question stands in for it in the key.
+        if QUERY_COALESCING:
+            flight_key = (scope, bool(speculative), normalize_question(question))
+            payload, coalesced = query_flights.do(flight_key, answer_question, email, status, question, query_enhancement_mode, speculative)
+        else:
+            payload, coalesced = answer_question(email, status, question, query_enhancement_mode, speculative), False
         
-        semantic = (chunking_method == "semantic")
-        
-        try:
-            user_vdb = get_user_rag_db(email, semantic=semantic)
-            
-            retriever = user_vdb.get_retriever(use_hybrid=hybrid_search, k=8 if use_reranker else 4)
-            
-            # Use enhanced query for retrieval
-            retrieved_docs = retriever.invoke(enhanced_query)
-            
-            # Apply reranking if enabled
-            if use_reranker and retrieved_docs:
-                try:
-                    importlib.reload(ai.reranker)
-                    from ai.reranker import Reranker
-                    reranker = Reranker(reranker_type=DEFAULT_RERANKER)
-                    retrieved_docs = reranker.rerank_docs(enhanced_query, retrieved_docs, top_k=4)
-                except Exception as rerank_error:
-                    print(f"âš  Reranking failed: {rerank_error}, using non-reranked docs")
-            
-            # Create custom retriever
-            class CustomRetriever:
-                def __init__(self, docs):
-                    self.docs = docs
-                def invoke(self, query):
-                    return self.docs
-            
-            custom_retriever = CustomRetriever(retrieved_docs)
-            rag_chain = build_rag_chain(llm_instance, custom_retriever)
-            
-            # Use enhanced query for answer generation
-            result = rag_chain.invoke(enhanced_query)
-            
-            return jsonify({
-                "success": True,
-                "answer": result["answer"],
-                "context": result["context_text"],
-                "source_docs": len(result["context_docs"]),
-                "retrieval_method": "Hybrid (Dense + BM25)" if hybrid_search else "Dense Only",
-                "chunking_method": chunking_method,
-                "reranker_used": use_reranker,
-                "reranker_type": DEFAULT_RERANKER if use_reranker else None,
-                "query_enhancement_mode": query_enhancement_mode,
-                "enhanced_query": enhanced_query if enhanced_query != question else None
-            }), 200
-            
-        finally:
-            # Always close the database connection
-            if user_vdb:
-                try:
-                    user_vdb.close()
-                    del user_vdb
-                except Exception as close_error:
-                    print(f"âš  Warning closing database: {close_error}")
+        if question_vector is not None:
+            answer_cache.store(email, scope, question, question_vector, payload)
+        return jsonify({**payload, "cached": False, "coalesced": coalesced}), 200
         
     except Exception as e:
-        error_msg = str(e)
-        print(f"âœ— Query error: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        return query_error_response(email, e)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/query/stream", methods=["POST"])
+def query_document_stream():
+    """
+    Server-sent-event variant of /query.
+    
+    Emits a "metadata" event (retrieval details and context) as soon as
+    retrieval finishes, one "token" event per LLM chunk, then a "done" event
+    with the full answer and timings. Tokens are pulled from the LLM only as
+    fast as the client reads them, and the LLM stream is closed if the client
+    disconnects.
+    """
+    email = None
+    try:
+        email = get_user_from_token(request.headers.get("Authorization"))
+        if not email:
+            return jsonify({"error": "Unauthorized", "success": False}), 401
         
-        # Attempt cleanup if database is corrupted
-        if "database" in error_msg.lower() and email:
-            print(f"Database error detected, attempting cleanup for {email}")
-            if email in user_processing_status:
-                user_processing_status[email]["status"] = "error"
+        status, question, query_enhancement_mode, error_response = parse_query_request(email)
+        if error_response:
+            return error_response
         
-        # Ensure database is closed
-        if user_vdb:
-            try:
-                user_vdb.close()
-            except:
-                pass
+        started = time.perf_counter()
+        enhanced_query, queries, retrieved_docs, speculation, retrieval_stats = enhance_and_retrieve(
+            email, status, question, query_enhancement_mode,
+            request.get_json().get("speculative_retrieval", SPECULATIVE_RETRIEVAL)
+        )
+        context_text, context_stats = pack_context(retrieved_docs)
+        metadata = {
+            "context": context_text,
+            "source_docs": len(retrieved_docs),
+            "context_stats": context_stats,
+            "retrieval_stats": retrieval_stats or None,
+            "speculation": speculation,
+            **query_metadata(status, question, enhanced_query, query_enhancement_mode, queries)
+        }
         
-        return jsonify({
-            "error": "Failed to process query. Please try again or reprocess your document.",
-            "success": False,
-            "details": error_msg if app.debug else None
-        }), 500
+    except Exception as e:
+        return query_error_response(email, e)
     
+    def generate():
+        yield sse_event("metadata", metadata)
+        tokens = build_answer_chain(llm_instance).stream({"context": context_text, "question": enhanced_query})
+        answer_parts = []
+        first_token_at = None
+        try:
+            for token in tokens:
+                if not token:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                answer_parts.append(token)
+                yield sse_event("token", {"text": token})
+            
+            finished = time.perf_counter()
+            yield sse_event("done", {
+                "success": True,
+                "answer": "".join(answer_parts),
+                "chunks_streamed": len(answer_parts),
+                "time_to_first_token_ms": round((first_token_at - started) * 1000, 1) if first_token_at else None,
+                "total_ms": round((finished - started) * 1000, 1)
+            })
+        except GeneratorExit:
+            print(f"Client disconnected from streamed answer for {email}")
+            raise
+        except Exception as e:
+            print(f"âœ— Streaming error: {e}")
+            yield sse_event("error", {
+                "error": "Failed to generate answer. Please try again.",
+                "success": False,
+                "details": str(e) if app.debug else None
+            })
+        finally:
+            tokens.close()
+    
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    try:
+        email = get_user_from_token(request.headers.get("Authorization"))
+        if not email:
+            return jsonify({"error": "Unauthorized"}), 401
+        vdb_pool.evict_idle()
+        return jsonify({
+            "vdb_pool": vdb_pool.stats(),
+            "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+            "embedder": embedder.stats() if embedder else None,
+            "enhancement_cache": enhancement_cache.stats() if enhancement_cache else None,
+            "answer_cache": answer_cache.stats() if answer_cache else None,
+            "query_coalescing": query_flights.stats(),
+            "shared_store": shared_store.stats() if shared_store else None,
+            "rerankers": reranker_registry.stats()
+        }), 200
+    except Exception as e:
+        print("Metrics error:", e)
+        return jsonify({"error": "Internal server error"}), 500
+
 @app.route('/')
 def serve_react():
     return send_from_directory(app.static_folder, 'index.html')
@@ -0,0 +1,149 @@
+"""
+Compare the Chroma and flat (NumPy, memory-mapped) dense backends of VectorDB.
+
+Writes the same chunks and embeddings into one vector DB per backend, then
+measures cold open (constructing VectorDB on the persisted directory and
+answering the first query) and warm query latency of the dense top-k and MMR
+searches, plus how often the two backends agree on the top-k.
+
+Uses a PDF's chunks embedded with the configured model, or with --synthetic N
+random unit vectors (no model needed).
+
+Run from the Backend directory:
+    python -m benchmarks.dense_backend_bench ../attention.pdf
+    python -m benchmarks.dense_backend_bench --synthetic 5000
+"""
+import argparse
+import shutil
+import tempfile
+import time
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from ai.constant import *
+from ai.vectorstore import FolderLoader, Splitter, VectorDB
+
+
+class StaticEmbeddings(Embeddings):
+    """Looks texts up in a precomputed table so both backends see identical vectors."""
+
+    def __init__(self, table, dim):
+        self.table = table
+        self.dim = dim
+        self.model_name = "bench-static"
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        vector = self.table.get(text)
+        if vector is None:
+            vector = np.random.default_rng(abs(hash(text)) % 2**32).standard_normal(self.dim)
+        return list(vector)
+
+
+def corpus(args):
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        texts = [f"synthetic chunk {i}" for i in range(args.synthetic)]
+        vectors = rng.standard_normal((args.synthetic, args.dim)).astype(np.float32)
+        # Unit length like sentence-transformers output, so Chroma's L2 ranking matches cosine
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    else:
+        from ai.embed import Embedder
+        pages = FolderLoader().load_file(args.pdf, {"doc_id": "bench"})
+        texts = [c.page_content for c in Splitter().split(pages)]
+        vectors = np.asarray(Embedder(EMBEDNAME).emb.embed_documents(texts), dtype=np.float32)
+    return texts, vectors
+
+
+def open_db(backend, workdir, embedding):
+    return VectorDB(embedding=embedding, persist_directory=workdir, registry_path=f"{workdir}/registry.json", dense_backend=backend)
+
+
+def build(backend, workdir, embedding, texts, vectors):
+    vdb = open_db(backend, workdir, embedding)
+    docs = [Document(page_content=t, metadata={"doc_id": "bench", "chunk_id": f"bench:{i}", "chunk_index": i}) for i, t in enumerate(texts)]
+    for start in range(0, len(docs), 1000):
+        vdb._write_batch(docs[start:start + 1000], vectors[start:start + 1000].tolist(), f"{start // 1000 + 1}")
+    vdb.persist()
+    vdb.close()
+
+
+def latencies(fn, queries, repeats):
+    for q in queries[:5]:
+        fn(q)  # warm-up
+    times = []
+    for _ in range(repeats):
+        for q in queries:
+            start = time.perf_counter()
+            fn(q)
+            times.append((time.perf_counter() - start) * 1000)
+    return np.array(times)
+
+
+def benchmark(backend, workdir, embedding, queries, k, repeats):
+    start = time.perf_counter()
+    vdb = open_db(backend, workdir, embedding)
+    vdb.similarity_search(queries[0], k=k)
+    cold_open = (time.perf_counter() - start) * 1000
+    try:
+        top_k = {q: [d.metadata["chunk_id"] for d in vdb.similarity_search(q, k=k)] for q in queries}
+        return {
+            "cold_open_ms": cold_open,
+            "similarity": latencies(lambda q: vdb.similarity_search(q, k=k), queries, repeats),
+            "mmr": latencies(lambda q: vdb.mmr_search(q, k=k, fetch_k=4 * k), queries, repeats),
+            "top_k": top_k,
+        }
+    finally:
+        vdb.close()
+
+
+def report(results, chunks, n_queries, k):
+    print(f"\n=== Dense backend benchmark ({chunks} chunks, {n_queries} queries, k={k}) ===")
+    print(f"{'backend':<10}{'cold open ms':>14}{'sim p50':>10}{'sim p95':>10}{'mmr p50':>10}{'mmr p95':>10}")
+    for backend, r in results.items():
+        print(f"{backend:<10}{r['cold_open_ms']:>14.1f}"
+              f"{np.percentile(r['similarity'], 50):>10.2f}{np.percentile(r['similarity'], 95):>10.2f}"
+              f"{np.percentile(r['mmr'], 50):>10.2f}{np.percentile(r['mmr'], 95):>10.2f}")
+    if {"chroma", "flat"} <= set(results):
+        chroma, flat = results["chroma"]["top_k"], results["flat"]["top_k"]
+        overlap = np.mean([len(set(chroma[q]) & set(flat[q])) / k for q in chroma])
+        print(f"Top-{k} agreement (flat is exact, Chroma's HNSW approximate): {overlap:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", help="PDF file to index")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N random vectors instead of a PDF")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension of the synthetic vectors")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    if not args.pdf and not args.synthetic:
+        parser.error("pass a PDF or --synthetic N")
+
+    texts, vectors = corpus(args)
+    # Queries are the chunk texts themselves, perturbed so they are not exact matches
+    rng = np.random.default_rng(1)
+    picked = rng.choice(len(texts), size=min(args.queries, len(texts)), replace=False)
+    table = dict(zip(texts, vectors))
+    queries = [f"query {i}" for i in picked]
+    for q, i in zip(queries, picked):
+        table[q] = vectors[i] + 0.1 * np.linalg.norm(vectors[i]) / np.sqrt(vectors.shape[1]) * rng.standard_normal(vectors.shape[1])
+    embedding = StaticEmbeddings(table, vectors.shape[1])
+
+    results = {}
+    for backend in ("chroma", "flat"):
+        workdir = tempfile.mkdtemp(prefix=f"dense_bench_{backend}_")
+        try:
+            build(backend, workdir, embedding, texts, vectors)
+            results[backend] = benchmark(backend, workdir, embedding, queries, args.k, args.repeats)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    report(results, len(texts), len(queries), args.k)
+
+
+if __name__ == "__main__":
+    main()
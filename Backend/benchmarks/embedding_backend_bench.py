@@ -0,0 +1,72 @@
+"""
+Compare the PyTorch and int8 ONNX embedding backends on a PDF's chunks.
+
+Checks accuracy parity (cosine between the backends' vectors and top-k
+retrieval agreement) and measures throughput of both. Exits with status 1 if
+the ONNX vectors drift below --min-cosine or --min-recall.
+
+Run from the Backend directory:
+    python -m benchmarks.embedding_backend_bench ../attention.pdf
+"""
+import argparse
+import sys
+import time
+from langchain_huggingface import HuggingFaceEmbeddings
+from ai.constant import *
+from ai.embed import embedding_parity, onnx_int8_embeddings
+from ai.vectorstore import FolderLoader, Splitter
+
+
+def throughput(embeddings, texts, batch_size, repeats):
+    embeddings.embed_documents(texts[:batch_size])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for i in range(0, len(texts), batch_size):
+            embeddings.embed_documents(texts[i:i + batch_size])
+    docs_per_second = repeats * len(texts) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for text in texts[:50]:
+        embeddings.embed_query(text)
+    query_ms = (time.perf_counter() - start) / min(50, len(texts)) * 1000
+    return docs_per_second, query_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", help="PDF file whose chunks are embedded")
+    parser.add_argument("--model", default=EMBEDNAME)
+    parser.add_argument("--quantization", default=EMBED_ONNX_QUANTIZATION)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Minimum mean cosine to the PyTorch vectors")
+    parser.add_argument("--min-recall", type=float, default=0.8, help="Minimum top-5 retrieval agreement")
+    args = parser.parse_args()
+
+    pages = FolderLoader().load_file(args.pdf, {"doc_id": "bench"})
+    texts = [c.page_content for c in Splitter().split(pages)]
+    # First sentence of every fifth chunk doubles as a query
+    queries = [t.split(".")[0][:200] for t in texts[::5]]
+
+    reference = HuggingFaceEmbeddings(model=args.model)
+    candidate = onnx_int8_embeddings(args.model, quantization=args.quantization, export_dir=EMBED_ONNX_DIR)
+
+    parity = embedding_parity(reference, candidate, texts, queries, k=5)
+    results = {
+        "torch": throughput(reference, texts, args.batch_size, args.repeats),
+        "onnx-int8": throughput(candidate, texts, args.batch_size, args.repeats),
+    }
+
+    print(f"\n=== Embedding backend benchmark ({len(texts)} chunks, {len(queries)} queries) ===")
+    print(f"Parity: mean cosine={parity['mean_cosine']:.4f} min cosine={parity['min_cosine']:.4f} recall@5={parity['recall_at_5']:.3f}")
+    for name, (docs_per_second, query_ms) in results.items():
+        print(f"{name:>10}: {docs_per_second:8.1f} chunks/s  {query_ms:6.2f} ms/query")
+    print(f"Speedup: {results['onnx-int8'][0] / results['torch'][0]:.2f}x chunks/s, {results['torch'][1] / results['onnx-int8'][1]:.2f}x per query")
+
+    if parity["mean_cosine"] < args.min_cosine or parity["recall_at_5"] < args.min_recall:
+        print("FAIL: int8 ONNX embeddings drift too far from the PyTorch model")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
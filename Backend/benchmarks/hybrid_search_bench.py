@@ -0,0 +1,96 @@
+"""
+Compare VectorDB.hybrid_search with the EnsembleRetriever-based hybrid retriever it replaced.
+
+Indexes a PDF into a temporary vector DB, then times both retrievers on
+queries taken from the document's chunks and reports latency percentiles and
+how often the two agree on the top results. First checks that weighted
+fusion keeps rank-only lists (the speculative prior results) in play.
+
+Run from the Backend directory:
+    python -m benchmarks.hybrid_search_bench ../attention.pdf
+"""
+import argparse
+import shutil
+import tempfile
+import time
+import numpy as np
+from langchain_classic.retrievers import EnsembleRetriever
+from ai.constant import *
+from ai.embed import Embedder
+from ai.vectorstore import DenseSearchRetriever, SparseIndexRetriever, VectorDB, fuse_rankings
+
+
+def ensemble_retriever(vdb, k, sparse_k, dense_weight, sparse_weight):
+    """The previous as_hybrid_retriever: dense and BM25 run one after the other, fused by EnsembleRetriever."""
+    dense = DenseSearchRetriever(vectordb=vdb, k=k, search_type="similarity")
+    sparse = SparseIndexRetriever(vectordb=vdb, k=sparse_k)
+    return EnsembleRetriever(retrievers=[dense, sparse], weights=[dense_weight, sparse_weight])
+
+
+def check_weighted_fusion(k=4):
+    """Prior results carry only ranks; in weighted fusion their top hits must still reach the top k."""
+    prior = (["p0", "p1", "p2", "p3"], None, 0.7)
+    dense = (["d0", "d1", "d2", "d3", "d4"], np.array([0.9, 0.85, 0.8, 0.75, 0.7]), 0.7)
+    sparse = (["s0", "s1", "s2"], np.array([12.0, 9.0, 4.0]), 0.3)
+    fused = [chunk_id for chunk_id, _ in fuse_rankings([prior, dense, sparse], method="weighted")[:k]]
+    assert "p0" in fused, f"weighted fusion dropped the prior results: {fused}"
+    print(f"Weighted fusion keeps prior results: {fused}")
+
+
+def time_queries(retriever, queries, repeats):
+    for q in queries[:5]:
+        retriever.invoke(q)  # warm-up
+    latencies, results = [], {}
+    for _ in range(repeats):
+        for q in queries:
+            start = time.perf_counter()
+            results[q] = retriever.invoke(q)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies), results
+
+
+def benchmark(vdb, queries, k=4, sparse_k=3, repeats=3):
+    ensemble = ensemble_retriever(vdb, k, sparse_k, 0.7, 0.3)
+    native = vdb.as_hybrid_retriever(k=k)
+    ensemble_ms, ensemble_docs = time_queries(ensemble, queries, repeats)
+    native_ms, native_docs = time_queries(native, queries, repeats)
+
+    overlaps = []
+    for q in queries:
+        before = {d.metadata.get("chunk_id") for d in ensemble_docs[q][:k]}
+        after = {d.metadata.get("chunk_id") for d in native_docs[q][:k]}
+        overlaps.append(len(before & after) / max(len(after), 1))
+    return {"ensemble": ensemble_ms, "native": native_ms, "top_k_overlap": float(np.mean(overlaps))}
+
+
+def report(results, n_queries):
+    print(f"\n=== Hybrid search benchmark ({n_queries} queries) ===")
+    for name in ("ensemble", "native"):
+        ms = results[name]
+        print(f"{name:>9}: mean={ms.mean():7.2f} ms  p50={np.percentile(ms, 50):7.2f} ms  p95={np.percentile(ms, 95):7.2f} ms")
+    print(f"Speedup (mean): {results['ensemble'].mean() / results['native'].mean():.2f}x")
+    print(f"Top-k overlap with ensemble results: {results['top_k_overlap']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", help="PDF file to index")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    check_weighted_fusion()
+    workdir = tempfile.mkdtemp(prefix="hybrid_bench_")
+    vdb = VectorDB(embedding=Embedder(EMBEDNAME).emb, persist_directory=workdir, registry_path=f"{workdir}/registry.json")
+    try:
+        vdb.ingest_file_incremental(args.pdf)
+        texts = vdb.collection.get(include=["documents"])["documents"]
+        queries = [t.split(".")[0][:200] for t in texts[::max(1, len(texts) // args.queries)]][:args.queries]
+        report(benchmark(vdb, queries, repeats=args.repeats), len(queries))
+    finally:
+        vdb.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Regression benchmark for build_rag_chain: counts retriever invocations per
+query and times the chain with a fake LLM, so only chain overhead is measured.
+
+Run from the Backend directory:
+    python -m benchmarks.rag_chain_bench --queries 200
+
+Exits with status 1 if the retriever is invoked more than once per query.
+"""
+import argparse
+import sys
+import time
+import types
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from ai.normal_chain import build_rag_chain
+
+
+class CountingRetriever:
+    def __init__(self, docs, delay: float = 0.0):
+        self.docs = docs
+        self.delay = delay
+        self.calls = 0
+
+    def invoke(self, query):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return self.docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--docs", type=int, default=8, help="Documents returned per retrieval")
+    parser.add_argument("--retrieval-ms", type=float, default=5.0, help="Simulated retrieval latency")
+    args = parser.parse_args()
+
+    docs = [
+        Document(page_content=f"Chunk {i} " + "lorem ipsum " * 40, metadata={"filename": "bench.pdf", "page": i, "doc_id": "bench", "chunk_id": f"bench::chunk{i}"})
+        for i in range(args.docs)
+    ]
+    retriever = CountingRetriever(docs, delay=args.retrieval_ms / 1000)
+    llm_obj = types.SimpleNamespace(llm=FakeListChatModel(responses=["answer"]))
+    chain = build_rag_chain(llm_obj, retriever)
+
+    start = time.perf_counter()
+    for i in range(args.queries):
+        result = chain.invoke(f"question {i}")
+        assert {"answer", "context_docs", "context_text"} <= set(result)
+    elapsed = time.perf_counter() - start
+
+    per_query = retriever.calls / args.queries
+    print(f"\n=== build_rag_chain benchmark ({args.queries} queries) ===")
+    print(f"Retriever invocations per query: {per_query:.2f}")
+    print(f"Mean latency per query: {elapsed / args.queries * 1000:.2f} ms")
+
+    if per_query > 1:
+        print("FAIL: retriever invoked more than once per query")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
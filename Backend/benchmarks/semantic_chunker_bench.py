@@ -0,0 +1,66 @@
+"""
+Compare CustomSemanticChunker with BatchedSemanticChunker on a PDF.
+
+Run from the Backend directory:
+    python -m benchmarks.semantic_chunker_bench ../attention.pdf
+"""
+import argparse
+import time
+from langchain_huggingface import HuggingFaceEmbeddings
+from ai.constant import *
+from ai.vectorstore import BatchedSemanticChunker, CustomSemanticChunker, FolderLoader
+
+
+class CountingEmbeddings:
+    """Wraps an embeddings object and counts model calls and embedded texts."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.calls = 0
+        self.texts = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.texts += 1
+        return self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return self.embeddings.embed_documents(texts)
+
+
+def run(chunker_cls, embeddings, pages):
+    counter = CountingEmbeddings(embeddings)
+    chunker = chunker_cls(embeddings=counter, similarity_threshold=0.75, min_chunk_size=100, max_chunk_size=1500)
+    start = time.perf_counter()
+    chunks = chunker.split(pages)
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "chunks": len(chunks), "calls": counter.calls, "texts": counter.texts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", help="PDF file to chunk")
+    parser.add_argument("--pages", type=int, default=15, help="Number of pages to use (default 15)")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only run the batched chunker")
+    args = parser.parse_args()
+
+    pages = FolderLoader().load_file(args.pdf, {"doc_id": "bench"})[:args.pages]
+    # The bare model: Embedder's memo would serve the legacy chunker's repeated sentences from memory
+    embeddings = HuggingFaceEmbeddings(model=EMBEDNAME)
+
+    results = {"batched": run(BatchedSemanticChunker, embeddings, pages)}
+    if not args.skip_legacy:
+        results["legacy"] = run(CustomSemanticChunker, embeddings, pages)
+
+    print(f"\n=== Semantic chunking benchmark ({len(pages)} pages) ===")
+    for name, r in results.items():
+        print(f"{name:>8}: {r['seconds']:8.2f}s  chunks={r['chunks']:<5} model_calls={r['calls']:<6} texts_embedded={r['texts']}")
+    if "legacy" in results:
+        speedup = results["legacy"]["seconds"] / max(results["batched"]["seconds"], 1e-9)
+        print(f"Speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Scaling benchmark of the shared multi-tenant store against per-user Chroma databases.
+
+Simulates --tenants tenants with --chunks random unit vectors each. In the
+shared mode all of them go into one SharedCollectionStore; the benchmark
+reports ingest time, open file descriptors, RSS and disk usage, latency of
+tenant-filtered queries (checking that no result belongs to another
+tenant), and the cost of deleting a tenant with a filtered delete. The
+first delete on a shard can take seconds after a bulk load, while Chroma
+indexes writes it has so far only kept in its log; that shows up in the
+delete p95.
+
+The per-user mode (one Chroma directory and client per tenant, as
+get_user_rag_db does with STORAGE_MODE = "per_user") is measured on
+--per-user-sample tenants held open at once, like a full VectorDBPool, and
+its file descriptors, RSS and disk usage are extrapolated to --tenants.
+File descriptor and RSS figures read /proc and need Linux.
+
+Run from the Backend directory:
+    python -m benchmarks.tenant_scaling_bench --tenants 10000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from langchain_chroma import Chroma
+from ai.constant import *
+from ai.tenant_store import TENANT_KEY, SharedCollectionStore
+from ai.vectorstore import release_chroma_system
+
+
+def open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def disk_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files) / 2**20
+
+
+def tenant_chunks(rng, tenant: int, chunks: int, dim: int):
+    vectors = rng.standard_normal((chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"doc{tenant}::chunk{i}" for i in range(chunks)]
+    metadatas = [{"doc_id": f"doc{tenant}", "chunk_index": i} for i in range(chunks)]
+    return ids, vectors.tolist(), metadatas, [f"tenant {tenant} chunk {i}" for i in range(chunks)]
+
+
+def percentiles(ms):
+    return f"p50 {np.percentile(ms, 50):.2f} ms, p95 {np.percentile(ms, 95):.2f} ms"
+
+
+def bench_shared(args, workdir):
+    rng = np.random.default_rng(0)
+    tenants = [f"user{t}@example.com" for t in range(args.tenants)]
+    fds, rss = open_fds(), rss_mb()
+    store = SharedCollectionStore(os.path.join(workdir, "shared"), shards=args.shards, collection_name=COLLECTION)
+
+    start = time.perf_counter()
+    for t, tenant in enumerate(tenants):
+        ids, vectors, metadatas, documents = tenant_chunks(rng, t, args.chunks, args.dim)
+        store.for_tenant(tenant).upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=documents)
+        if (t + 1) % 1000 == 0:
+            print(f"  {t + 1}/{len(tenants)} tenants ingested")
+    ingest = time.perf_counter() - start
+
+    latencies, leaked = [], 0
+    for t in rng.choice(len(tenants), size=args.queries):
+        query = rng.standard_normal((1, args.dim)).tolist()
+        start = time.perf_counter()
+        result = store.for_tenant(tenants[t]).query(query_embeddings=query, n_results=args.k, include=["metadatas", "distances"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        leaked += sum(1 for m in result["metadatas"][0] if m.get(TENANT_KEY) != tenants[t])
+
+    deleted = rng.choice(len(tenants), size=min(args.deletes, len(tenants)), replace=False)
+    delete_ms = []
+    for t in deleted:
+        start = time.perf_counter()
+        store.delete_tenant(tenants[t])
+        delete_ms.append((time.perf_counter() - start) * 1000)
+    left_behind = sum(store.for_tenant(tenants[t]).count() for t in deleted[:20])
+    remaining = store.stats()["chunks"]
+
+    print(f"\n--- Shared store ({args.tenants} tenants x {args.chunks} chunks, {args.shards} shards) ---")
+    print(f"Ingest: {ingest:.1f} s ({args.tenants * args.chunks / ingest:.0f} chunks/s)")
+    print(f"Open file descriptors: +{open_fds() - fds}, RSS: +{rss_mb() - rss:.0f} MB, disk: {disk_mb(workdir):.0f} MB")
+    print(f"Tenant-filtered query (k={args.k}): {percentiles(latencies)}, results from other tenants: {leaked}")
+    print(f"Delete tenant (filtered delete): {percentiles(delete_ms)}, max {max(delete_ms):.0f} ms, chunks left behind: {left_behind}")
+    print(f"Chunks remaining: {remaining} (expected {(args.tenants - len(deleted)) * args.chunks})")
+
+
+def bench_per_user(args, workdir):
+    rng = np.random.default_rng(0)
+    sample = min(args.per_user_sample, args.tenants)
+    fds, rss = open_fds(), rss_mb()
+    dbs = []
+
+    start = time.perf_counter()
+    for t in range(sample):
+        directory = os.path.join(workdir, f"user{t}")
+        db = Chroma(persist_directory=directory, collection_name=COLLECTION)
+        ids, vectors, metadatas, documents = tenant_chunks(rng, t, args.chunks, args.dim)
+        db._collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=documents)
+        dbs.append((directory, db))
+    ingest = time.perf_counter() - start
+    fds_per_tenant = (open_fds() - fds) / sample
+    rss_per_tenant = (rss_mb() - rss) / sample
+    disk_per_tenant = disk_mb(workdir) / sample
+
+    latencies = []
+    for t in rng.choice(sample, size=args.queries):
+        query = rng.standard_normal((1, args.dim)).tolist()
+        start = time.perf_counter()
+        dbs[t][1]._collection.query(query_embeddings=query, n_results=args.k, include=["metadatas", "distances"])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    delete_ms = []
+    for directory, db in dbs[:min(args.deletes, sample)]:
+        start = time.perf_counter()
+        release_chroma_system(directory, db._client._system)
+        shutil.rmtree(directory)
+        delete_ms.append((time.perf_counter() - start) * 1000)
+
+    print(f"\n--- Per-user databases ({sample} tenants open at once) ---")
+    print(f"Ingest: {ingest:.1f} s ({sample * args.chunks / ingest:.0f} chunks/s)")
+    print(f"Per tenant: {fds_per_tenant:.1f} file descriptors, {rss_per_tenant:.1f} MB RSS, {disk_per_tenant:.2f} MB disk")
+    print(f"Extrapolated to {args.tenants} tenants: {fds_per_tenant * args.tenants:.0f} file descriptors, "
+          f"{rss_per_tenant * args.tenants / 1024:.1f} GB RSS, {disk_per_tenant * args.tenants / 1024:.1f} GB disk")
+    print(f"Query (k={args.k}): {percentiles(latencies)}")
+    print(f"Delete tenant (release + rmtree): {percentiles(delete_ms)}")
+
+    for directory, db in dbs[len(delete_ms):]:
+        release_chroma_system(directory, db._client._system)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=10000)
+    parser.add_argument("--chunks", type=int, default=20, help="Chunks per tenant")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--shards", type=int, default=TENANT_SHARDS)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--deletes", type=int, default=100)
+    parser.add_argument("--per-user-sample", type=int, default=200, help="Per-user databases to open (0 to skip)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="tenant_bench_")
+    try:
+        if args.per_user_sample:
+            bench_per_user(args, os.path.join(workdir, "per_user"))
+        bench_shared(args, os.path.join(workdir, "shared_store"))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
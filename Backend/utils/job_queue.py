@@ -0,0 +1,151 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    """A background job with cooperative cancellation and page/chunk progress."""
+
+    def __init__(self, owner: str):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.state = "queued"  # queued -> running -> done | failed | cancelled
+        self.error: Optional[str] = None
+        self.pages_done = 0
+        self.chunks_done = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self._done_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done_event.wait(timeout)
+
+    def update_progress(self, pages_done: int, chunks_done: int):
+        self.pages_done = pages_done
+        self.chunks_done = chunks_done
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "pages_done": self.pages_done,
+            "chunks_done": self.chunks_done,
+            "elapsed_seconds": round(end - (self.started_at or end), 2),
+            "error": self.error
+        }
+
+
+class JobQueue:
+    """
+    Bounded worker pool for long-running jobs, with at most one active job per owner.
+
+    Submitting a job for an owner cancels the owner's previous job, and the
+    new job only starts once the previous one has stopped, so an owner's jobs
+    never run at the same time and callers never have to wait for the
+    cancellation themselves. Jobs are expected to poll ``job.cancelled``; an
+    exception raised after cancellation marks the job as cancelled rather
+    than failed.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, keep_finished: int = 256):
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, Job] = {}
+        self._pending = 0
+
+    def submit(self, owner: str, fn: Callable[..., Any], *args, on_created: Optional[Callable[[Job], None]] = None, **kwargs) -> Job:
+        """
+        Queue ``fn(job, *args, **kwargs)`` for owner.
+
+        ``on_created`` is called with the new job before it can start, so
+        state keyed by ``job.id`` (e.g. a status entry the job later updates)
+        is in place before the job runs.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"Job queue is full ({self.max_pending} pending jobs)")
+            previous = self._active.get(owner)
+            if previous and not previous.finished:
+                previous.cancel()
+            else:
+                previous = None
+            job = Job(owner)
+            if on_created:
+                on_created(job)
+            self._jobs[job.id] = job
+            self._active[owner] = job
+            self._pending += 1
+            self._prune()
+            # Queued under the lock, so the executor sees an owner's jobs in order
+            self._executor.submit(self._run, job, previous, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, previous: Optional[Job], fn: Callable[..., Any], args, kwargs):
+        try:
+            # The executor starts jobs in submission order, so previous is
+            # already on a worker (or done) and this wait cannot deadlock
+            if previous:
+                previous.wait()
+            if job.cancelled:
+                job.state = "cancelled"
+                return
+            job.state = "running"
+            job.started_at = time.time()
+            fn(job, *args, **kwargs)
+            job.state = "cancelled" if job.cancelled else "done"
+        except Exception as e:
+            job.state = "cancelled" if job.cancelled else "failed"
+            job.error = str(e)
+            if job.state == "failed":
+                print(f"Job {job.id} for {job.owner} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._pending -= 1
+            job._done_event.set()
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.finished and self._active.get(j.owner) is not j]
+        for j in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[j.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def active_job(self, owner: str) -> Optional[Job]:
+        return self._active.get(owner)
+
+    def cancel(self, owner: str) -> bool:
+        """
+        Ask the owner's active job to stop, without waiting for it. It stays the
+        owner's active job until it finishes, so the next submit still waits.
+        """
+        with self._lock:
+            job = self._active.get(owner)
+        if not job or job.finished:
+            return False
+        job.cancel()
+        return True
@@ -0,0 +1,75 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for it and receive the same result (or exception). Waiters
+    that are still blocked after wait_timeout seconds run the function
+    themselves instead, so one stuck call can't hold everyone else hostage.
+    Nothing is cached once a flight lands.
+    """
+
+    def __init__(self, wait_timeout: Optional[float] = None):
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.executions = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """Run fn(*args, **kwargs) once per in-flight key. Returns (result, shared)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.executions += 1
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            if flight.done.wait(self.wait_timeout):
+                with self._lock:
+                    self.shared += 1
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result, True
+            with self._lock:
+                self.timeouts += 1
+                self.executions += 1
+            return fn(*args, **kwargs), False
+
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "waiting": sum(f.waiters for f in self._flights.values()),
+                "executions": self.executions,
+                "shared_results": self.shared,
+                "wait_timeouts": self.timeouts
+            }